@@ -0,0 +1,84 @@
+import logging
+from typing import Any, Dict, FrozenSet, Hashable, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from app.services.cache import TTLCache
+from app.db.sql_parser import referenced_tables
+
+DEFAULT_TABLE_TTLS: Dict[str, int] = {
+    "stocks": 30,
+    "stock_movements": 30,
+    "items": 300,
+    "delivery_notes": 120,
+    "delivery_note_lines": 120,
+    "invoices": 120,
+    "invoice_lines": 120,
+    "sales_returns": 300,
+    "sales_return_lines": 300,
+    "customers": 300,
+    "suppliers": 600,
+    "brands": 3600,
+    "item_categories": 3600,
+    "item_equivalents": 3600,
+    "vehicles": 3600,
+}
+
+DEFAULT_WATERMARKS: Dict[str, str] = {
+    "stock_movements": "SELECT MAX(created_at) FROM stock_movements",
+    "stocks": "SELECT COUNT(*), SUM(quantity) FROM stocks",
+}
+
+
+def tables_in_query(query: str) -> FrozenSet[str]:
+    return frozenset(referenced_tables(query))
+
+
+def result_key(query: str, params: Optional[Dict[str, Any]]) -> Hashable:
+    return (query, tuple(sorted(params.items()))) if params else query
+
+
+class ResultCache(TTLCache):
+    def __init__(self,
+                 max_size: int = 256,
+                 default_ttl: int = 60,
+                 table_ttls: Optional[Dict[str, int]] = None,
+                 watermark_queries: Optional[Dict[str, str]] = None):
+        super().__init__(max_size=max_size, ttl_seconds=default_ttl)
+        self._default_ttl = default_ttl
+        self._table_ttls = dict(DEFAULT_TABLE_TTLS if table_ttls is None else table_ttls)
+        self._watermark_queries = dict(DEFAULT_WATERMARKS if watermark_queries is None else watermark_queries)
+        self._watermarks: Dict[str, Any] = {}
+
+    def ttl_for(self, tables: FrozenSet[str]) -> int:
+        if not tables:
+            return self._default_ttl
+        return min(self._table_ttls.get(table, self._default_ttl) for table in tables)
+
+    def get_result(self, query: str, params: Optional[Dict[str, Any]] = None) -> Optional[Any]:
+        entry = self.get(result_key(query, params))
+        return entry[1] if entry is not None else None
+
+    def put_result(self, query: str, result: Any, params: Optional[Dict[str, Any]] = None) -> None:
+        tables = tables_in_query(query)
+        ttl = self.ttl_for(tables)
+        if ttl <= 0:
+            return
+        self.set(result_key(query, params), (tables, result), ttl_seconds=ttl)
+
+    def invalidate_table(self, table: str) -> int:
+        return self.invalidate_where(lambda _, entry: table in entry[0])
+
+    def refresh_watermarks(self, engine: Engine) -> int:
+        invalidated = 0
+        with engine.connect() as connection:
+            for table, probe in self._watermark_queries.items():
+                try:
+                    watermark = tuple(connection.execute(text(probe)).fetchone() or ())
+                except Exception as e:
+                    logging.warning("Watermark probe failed for %s: %s", table, e)
+                    continue
+                previous = self._watermarks.get(table)
+                self._watermarks[table] = watermark
+                if previous is not None and previous != watermark:
+                    invalidated += self.invalidate_table(table)
+        return invalidated
@@ -1,101 +1,425 @@
 import os
 import re
-import sqlparse
-from typing import Optional, Any
+import json
+import asyncio
+import logging
+import threading
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Any, Callable, Dict, List, NamedTuple, Tuple, Union
 from urllib.parse import quote_plus
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, exc, text
 from sqlalchemy.engine import Engine, CursorResult
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from app.db.cache import ResultCache
+from app.db.sql_parser import extract_queries, normalize_query
+from app.db.router import EngineRouter, as_router
+from app.services.cache import TTLCache
 
-def create_engine_for_sql_database(connection_string: str) -> Engine:
+SELECT_HINT_PATTERN = re.compile(r"^(\(*\s*SELECT)\b", re.IGNORECASE)
+BIND_PATTERN = re.compile(r"(?<!:):(\w+)")
+FETCH_BATCH_SIZE = 100
+CANCEL_GRACE_SECONDS = 1.0
+
+def sql_literal(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "''") + "'"
+
+class BoundQuery(NamedTuple):
+    sql: str
+    params: Dict[str, Any]
+
+    def render(self) -> str:
+        return BIND_PATTERN.sub(lambda match: sql_literal(self.params[match.group(1)]), self.sql)
+
+Query = Union[str, BoundQuery]
+
+def build_database_url(connection_string: str, override_env: str = "DATABASE_URL") -> str:
+    if os.getenv(override_env):
+        return os.getenv(override_env)
     username = quote_plus(os.getenv("AI_USERNAME"))
     password = quote_plus(os.getenv("AI_PASSWORD"))
     host = os.getenv("DB_HOST")
     port = os.getenv("DB_PORT")
     database = os.getenv("DB_DATABASE")
-    url = f"{connection_string}//{username}:{password}@{host}:{port}/{database}"
-    engine = create_engine(
-        url,
-        pool_pre_ping=True,
-        pool_recycle=28800,
-        echo=False,
-    )
+    return f"{connection_string}//{username}:{password}@{host}:{port}/{database}"
+
+def pool_options(url: str, is_async: bool = False) -> dict[str, Any]:
+    options = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_POOL_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE_SECONDS", "28800")),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "idle") == "always",
+        "echo": False,
+    }
+    if url.startswith("sqlite"):
+        options["poolclass"] = AsyncAdaptedQueuePool if is_async else QueuePool
+        if not is_async:
+            options["connect_args"] = {"check_same_thread": False}
+    return options
+
+def install_idle_ping(engine: Union[Engine, AsyncEngine], idle_seconds: float) -> None:
+    pool = getattr(engine, "sync_engine", engine).pool
+
+    def on_checkin(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+        except Exception as e:
+            raise exc.DisconnectionError() from e
+        finally:
+            cursor.close()
+
+    event.listen(pool, "checkin", on_checkin)
+    event.listen(pool, "checkout", on_checkout)
+
+def create_pooled_engine(url: str, is_async: bool = False) -> Union[Engine, AsyncEngine]:
+    engine = (create_async_engine if is_async else create_engine)(url, **pool_options(url, is_async))
+    if os.getenv("DB_POOL_PRE_PING", "idle") == "idle":
+        install_idle_ping(engine, float(os.getenv("DB_POOL_PING_IDLE_SECONDS", "300")))
     return engine
 
-def get_element_str(sentence: str, start: str, end: str) -> str:
-    sentence_list = sentence.split()
-    res = []
-    switch: bool = False
-
-    for indexed_sentence in sentence_list:
-        if indexed_sentence == start:
-            switch = True
-        if switch == True:
-            res.append(indexed_sentence)
-        if indexed_sentence.find(end) != -1:
-            switch = False
-    return " ".join(res)
-
-def add_limit_select(query: str, max_limit: Optional[int]) -> str:
-    if max_limit is None:
-        return query.strip().rstrip(';') + ';'
-    query = re.sub(r';\s*$', '', query)
-    limit_match = re.search(r'\bLIMIT\s+(\d+)', query, re.IGNORECASE)
-    if limit_match:
-        existing_limit = int(limit_match.group(1))
-        if existing_limit > max_limit:
-            query = re.sub(
-                r'\bLIMIT\s+\d+',
-                f'LIMIT {max_limit}',
-                query,
-                flags=re.IGNORECASE
-            )
-    else:
-        query += f' LIMIT {max_limit}'
-    return query.strip() + ';'
+def create_engine_for_sql_database(connection_string: str) -> Engine:
+    return create_pooled_engine(build_database_url(connection_string))
 
+def create_async_engine_for_sql_database(connection_string: str) -> AsyncEngine:
+    return create_pooled_engine(build_database_url(connection_string, "ASYNC_DATABASE_URL"), is_async=True)
 
 def verify_and_extract_sql_query(query: str, max_limit: Optional[int]) -> list[str]:
-    query = sqlparse.format(query, reindent=True, keyword_case="upper")
-    clean_query = get_element_str(query, "SELECT", ";")
-    if not clean_query:
-        return []
-    queries = clean_query.split(";")
-    return [add_limit_select(q.strip(), max_limit) for q in queries if q.strip()]
+    return extract_queries(query, max_limit)
+
+class QueryTimeoutError(TimeoutError):
+    pass
+
+class QueryCostError(ValueError):
+    def __init__(self, reason: str, query: str):
+        super().__init__(f"Query rejected as too expensive: {reason}")
+        self.reason = reason
+        self.query = query
+
+FULL_SCAN_ACCESS_TYPES = {"ALL", "index"}
+
+class QueryPlan(NamedTuple):
+    cost: float
+    tables: List[Tuple[str, str, float]]
+    filesort: bool
+    temporary: bool
+
+def collect_plan_nodes(node: Any, tables: list, flags: set) -> None:
+    if isinstance(node, list):
+        for item in node:
+            collect_plan_nodes(item, tables, flags)
+        return
+    if not isinstance(node, dict):
+        return
+    for key, value in node.items():
+        if key == "table" and isinstance(value, dict):
+            tables.append((
+                value.get("table_name", "?"),
+                value.get("access_type", ""),
+                float(value.get("rows_examined_per_scan", 0) or 0),
+            ))
+        elif key in ("using_filesort", "using_temporary_table") and value is True:
+            flags.add(key)
+        collect_plan_nodes(value, tables, flags)
+
+def parse_explain(document: Union[str, bytes, Dict[str, Any]]) -> QueryPlan:
+    plan = json.loads(document) if isinstance(document, (str, bytes)) else document
+    query_block = plan.get("query_block", {})
+    tables: list = []
+    flags: set = set()
+    collect_plan_nodes(query_block, tables, flags)
+    cost = float(query_block.get("cost_info", {}).get("query_cost", 0) or 0)
+    return QueryPlan(cost, tables, "using_filesort" in flags, "using_temporary_table" in flags)
+
+class CostGuard:
+    def __init__(self, max_cost: float = 100000, max_scan_rows: float = 200000,
+                 max_sort_rows: float = 50000, cache_size: int = 1024, ttl_seconds: float = 600):
+        self._max_cost = max_cost
+        self._max_scan_rows = max_scan_rows
+        self._max_sort_rows = max_sort_rows
+        self._verdicts = TTLCache(max_size=cache_size, ttl_seconds=ttl_seconds)
+        self.checked = 0
+        self.rejected = 0
+
+    def applies_to(self, dialect_name: str) -> bool:
+        return dialect_name == "mysql"
+
+    def assess(self, plan: QueryPlan) -> str:
+        reasons = []
+        scanned = 0.0
+        for table, access_type, rows in plan.tables:
+            scanned = max(scanned, rows)
+            if access_type in FULL_SCAN_ACCESS_TYPES and rows > self._max_scan_rows:
+                how = "full index scan" if access_type == "index" else "full table scan"
+                reasons.append(f"{how} of {table} (~{int(rows)} rows, no selective indexed condition)")
+        if (plan.filesort or plan.temporary) and scanned > self._max_sort_rows:
+            reasons.append(f"sorts or groups ~{int(scanned)} rows without an index")
+        if plan.cost > self._max_cost:
+            reasons.append(f"estimated cost {int(plan.cost)} exceeds the budget of {int(self._max_cost)}")
+        return "; ".join(reasons)
+
+    def cached(self, query: str) -> Tuple[str, Optional[str]]:
+        key = normalize_query(query, keep_bounds=True)
+        return key, self._verdicts.get(key)
+
+    def record(self, key: str, document: Any) -> str:
+        verdict = self.assess(parse_explain(document))
+        self._verdicts.set(key, verdict)
+        return verdict
+
+    def enforce(self, query: str, verdict: str) -> None:
+        self.checked += 1
+        if verdict:
+            self.rejected += 1
+            raise QueryCostError(verdict, query)
+
+    def check(self, connection: Any, query: str, params: Optional[Dict[str, Any]] = None) -> None:
+        key, verdict = self.cached(query)
+        if verdict is None:
+            document = connection.execute(text(f"EXPLAIN FORMAT=JSON {query}"), params or {}).scalar()
+            verdict = self.record(key, document)
+        self.enforce(query, verdict)
+
+    async def acheck(self, connection: Any, query: str, params: Optional[Dict[str, Any]] = None) -> None:
+        key, verdict = self.cached(query)
+        if verdict is None:
+            document = (await connection.execute(text(f"EXPLAIN FORMAT=JSON {query}"), params or {})).scalar()
+            verdict = self.record(key, document)
+        self.enforce(query, verdict)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "checked": self.checked,
+            "rejected": self.rejected,
+            "explain_hits": self._verdicts.hits,
+            "explain_misses": self._verdicts.misses,
+        }
+
+class ResultSet:
+    __slots__ = ("columns", "rows", "truncated")
+
+    def __init__(self, columns: tuple, rows: list[tuple], truncated: bool = False):
+        self.columns = columns
+        self.rows = rows
+        self.truncated = truncated
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def as_dicts(self) -> list[dict[str, Any]]:
+        return [dict(zip(self.columns, row)) for row in self.rows]
 
-def extract_content(result: CursorResult) -> list[dict[str, Any]]:
+@lru_cache(maxsize=None)
+def get_query_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=int(os.getenv("DB_MAX_PARALLEL_QUERIES", "4")),
+        thread_name_prefix="sql-query",
+    )
+
+def add_execution_hint(query: str, timeout: Optional[float], dialect_name: str) -> str:
+    if not timeout or dialect_name != "mysql":
+        return query
+    hint = f"/*+ MAX_EXECUTION_TIME({int(timeout * 1000)}) */"
+    return SELECT_HINT_PATTERN.sub(lambda match: f"{match.group(1)} {hint}", query, count=1)
+
+def is_timeout_error(error: Exception) -> bool:
+    return "maximum statement execution time exceeded" in str(error)
+
+def extract_content(result: CursorResult, max_rows: Optional[int] = None) -> ResultSet:
+    if not result.returns_rows:
+        return ResultSet((), [])
+    columns = tuple(result.keys())
+    rows = []
+    while True:
+        size = FETCH_BATCH_SIZE if max_rows is None else min(FETCH_BATCH_SIZE, max_rows + 1 - len(rows))
+        batch = result.fetchmany(size)
+        if not batch:
+            break
+        rows.extend(tuple(row) for row in batch)
+        if max_rows is not None and len(rows) > max_rows:
+            del rows[max_rows:]
+            result.close()
+            return ResultSet(columns, rows, truncated=True)
+    return ResultSet(columns, rows)
+
+def kill_query(engine: Engine, connection_id: int) -> None:
     try:
-        rows = result.fetchall()
-        if rows:
-            return [dict(row._asdict()) for row in rows]
-        else:
-            return [{"status": "success", "rows_affected": result.rowcount}]
-    except Exception:
-        return [{"status": "success", "rows_affected": result.rowcount}]
+        with engine.connect() as connection:
+            connection.execute(text(f"KILL QUERY {int(connection_id)}"))
+    except Exception as e:
+        logging.warning("Could not cancel query on connection %s: %s", connection_id, e)
+
+def make_canceller(engine: Engine, connection: Any) -> Callable[[], None]:
+    if engine.dialect.name == "mysql":
+        connection_id = connection.execute(text("SELECT CONNECTION_ID()")).scalar()
+        return lambda: kill_query(engine, connection_id)
+    return getattr(connection.connection, "interrupt", lambda: None)
 
-def execute_queries(engine: Engine, query_list: list[str]) -> list[str]:
+def split_cached_queries(query_list: list[Query], cache: Optional[ResultCache]) -> tuple[list, list]:
     results = []
+    pending = []
+    for query in query_list:
+        sql, params = (query.sql, query.params) if isinstance(query, BoundQuery) else (query, None)
+        if not sql or not sql.strip():
+            continue
+        clean_query = sql.strip().rstrip(';') + ";"
+        cached = cache.get_result(clean_query, params) if cache is not None else None
+        results.append(cached)
+        if cached is None:
+            pending.append((len(results) - 1, clean_query, params))
+    return results, pending
 
+def store_results(results: list, pending: list, outputs: list, cache: Optional[ResultCache]) -> list:
+    for (index, clean_query, params), output in zip(pending, outputs):
+        results[index] = output
+        if cache is not None:
+            cache.put_result(clean_query, output, params)
+    return results
+
+def execute_statement(router: EngineRouter, query: str, max_rows: Optional[int] = None,
+                      timeout: Optional[float] = None, params: Optional[Dict[str, Any]] = None,
+                      guard: Optional[CostGuard] = None) -> ResultSet:
+    engine, connection = router.connect()
+    with connection:
+        if guard is not None and guard.applies_to(engine.dialect.name):
+            guard.check(connection, query, params)
+        timer = None
+        fired = threading.Event()
+        if timeout:
+            cancel = make_canceller(engine, connection)
+            timer = threading.Timer(timeout, lambda: (fired.set(), cancel()))
+            timer.daemon = True
+            timer.start()
+        try:
+            result = connection.execute(text(add_execution_hint(query, timeout, engine.dialect.name)), params or {})
+            return extract_content(result, max_rows)
+        except Exception as e:
+            if fired.is_set() or is_timeout_error(e):
+                raise QueryTimeoutError(f"Query exceeded {timeout}s: {query}") from e
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+def execute_queries(engine: Union[Engine, EngineRouter], query_list: list[Query],
+                    cache: Optional[ResultCache] = None, max_rows: Optional[int] = None,
+                    timeout: Optional[float] = None, guard: Optional[CostGuard] = None) -> list[ResultSet]:
     if not query_list:
+        return []
+    router = as_router(engine)
+    results, pending = split_cached_queries(query_list, cache)
+    if not pending:
         return results
     try:
-        with engine.connect() as connection:
-            for query in query_list:
-                if not query or not query.strip():
-                    continue
-                clean_query = query.strip().rstrip(';') + ";"
-                result = connection.execute(text(clean_query))
-                
-                extracted_data = extract_content(result)
-                results.append(extracted_data)
-                
-            return results
-            
+        if len(pending) == 1:
+            _, clean_query, params = pending[0]
+            outputs = [execute_statement(router, clean_query, max_rows, timeout, params, guard)]
+        else:
+            futures = [
+                get_query_executor().submit(execute_statement, router, clean_query, max_rows, timeout, params, guard)
+                for _, clean_query, params in pending
+            ]
+            outputs = [future.result() for future in futures]
+        return store_results(results, pending, outputs, cache)
+
+    except QueryCostError as e:
+        logging.warning("%s: %s", e, e.query)
+        raise
+    except Exception as e:
+        logging.error("Erreur lors de l'exécution des requêtes: %s", e)
+        raise
+
+async def akill_query(engine: AsyncEngine, connection_id: int) -> None:
+    async def kill() -> None:
+        async with engine.connect() as connection:
+            await connection.execute(text(f"KILL QUERY {int(connection_id)}"))
+    try:
+        await asyncio.wait_for(kill(), timeout=CANCEL_GRACE_SECONDS)
+    except Exception as e:
+        logging.warning("Could not cancel query on connection %s: %s", connection_id, e)
+
+async def acancel_query(engine: AsyncEngine, connection: Any, connection_id: Optional[int]) -> None:
+    if connection_id is not None:
+        await akill_query(engine, connection_id)
+        return
+    raw_connection = await connection.get_raw_connection()
+    driver_connection = getattr(raw_connection.connection, "driver_connection", None)
+    interrupt = getattr(driver_connection, "interrupt", None)
+    if interrupt is not None:
+        await interrupt()
+
+async def aexecute_statement(router: EngineRouter, query: str, max_rows: Optional[int] = None,
+                             timeout: Optional[float] = None, params: Optional[Dict[str, Any]] = None,
+                             guard: Optional[CostGuard] = None) -> ResultSet:
+    engine, connection = await router.aconnect()
+    try:
+        if guard is not None and guard.applies_to(engine.dialect.name):
+            await guard.acheck(connection, query, params)
+        connection_id = None
+        if timeout and engine.dialect.name == "mysql":
+            connection_id = (await connection.execute(text("SELECT CONNECTION_ID()"))).scalar()
+        statement = text(add_execution_hint(query, timeout, engine.dialect.name))
+        execution = asyncio.ensure_future(connection.execute(statement, params or {}))
+        done, _ = await asyncio.wait({execution}, timeout=timeout)
+        if not done:
+            await acancel_query(engine, connection, connection_id)
+            finished, _ = await asyncio.wait({execution}, timeout=CANCEL_GRACE_SECONDS)
+            if finished and not execution.cancelled():
+                execution.exception()
+            else:
+                execution.cancel()
+            await connection.invalidate()
+            raise QueryTimeoutError(f"Query exceeded {timeout}s: {query}")
+        try:
+            result = execution.result()
+        except Exception as e:
+            if is_timeout_error(e):
+                raise QueryTimeoutError(f"Query exceeded {timeout}s: {query}") from e
+            raise
+        return extract_content(result, max_rows)
+    finally:
+        await connection.close()
+
+async def aexecute_queries(engine: Union[AsyncEngine, EngineRouter], query_list: list[Query],
+                           cache: Optional[ResultCache] = None, max_rows: Optional[int] = None,
+                           timeout: Optional[float] = None, guard: Optional[CostGuard] = None) -> list[ResultSet]:
+    if not query_list:
+        return []
+    router = as_router(engine)
+    results, pending = split_cached_queries(query_list, cache)
+    if not pending:
+        return results
+    semaphore = asyncio.Semaphore(int(os.getenv("DB_MAX_PARALLEL_QUERIES", "4")))
+
+    async def run(clean_query: str, params: Optional[Dict[str, Any]]) -> ResultSet:
+        async with semaphore:
+            return await aexecute_statement(router, clean_query, max_rows, timeout, params, guard)
+
+    try:
+        outputs = await asyncio.gather(*(run(clean_query, params) for _, clean_query, params in pending))
+        return store_results(results, pending, list(outputs), cache)
+
+    except QueryCostError as e:
+        logging.warning("%s: %s", e, e.query)
+        raise
     except Exception as e:
-        print(f"Erreur lors de l'exécution des requêtes: {e}")
+        logging.error("Erreur lors de l'exécution des requêtes: %s", e)
         raise
 
-def is_empty_result(data: list[str]) -> bool:
-    if not isinstance(data, list) or len(data) != 1:
+def is_empty_result(data: list) -> bool:
+    if not isinstance(data, list) or not data:
         return False
-    row = data[0]
-    return isinstance(row, dict) and row.get("rows_affected") == 0
\ No newline at end of file
+    return all(isinstance(result, ResultSet) and not result.rows for result in data)
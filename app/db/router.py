@@ -0,0 +1,132 @@
+import time
+import asyncio
+import logging
+import itertools
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import exc
+
+CheckoutObserver = Callable[[str, float], None]
+
+
+class EngineRouter:
+    def __init__(self, primary: Any, replicas: Optional[List[Any]] = None, cooldown_seconds: float = 30.0):
+        self.primary = primary
+        self.replicas = list(replicas or [])
+        self._names: Dict[int, str] = {id(primary): "primary"}
+        for index, replica in enumerate(self.replicas):
+            self._names[id(replica)] = f"replica{index}"
+        self._cooldown = cooldown_seconds
+        self._down_until: Dict[int, float] = {}
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._observer: Optional[CheckoutObserver] = None
+
+    def engines(self) -> List[Any]:
+        return [self.primary] + self.replicas
+
+    def name_of(self, engine: Any) -> str:
+        return self._names.get(id(engine), "unknown")
+
+    def set_checkout_observer(self, observer: Optional[CheckoutObserver]) -> None:
+        self._observer = observer
+
+    def candidates(self) -> List[Any]:
+        if not self.replicas:
+            return [self.primary]
+        start = next(self._next) % len(self.replicas)
+        ordered = self.replicas[start:] + self.replicas[:start]
+        now = time.monotonic()
+        with self._lock:
+            healthy = [engine for engine in ordered if self._down_until.get(id(engine), 0.0) <= now]
+        cooling = [engine for engine in ordered if engine not in healthy]
+        return healthy + [self.primary] + cooling
+
+    def mark_down(self, engine: Any, error: Exception) -> None:
+        logging.warning("Database %s unavailable, failing over: %s", self.name_of(engine), error)
+        with self._lock:
+            self._down_until[id(engine)] = time.monotonic() + self._cooldown
+
+    def mark_up(self, engine: Any) -> None:
+        if id(engine) in self._down_until:
+            with self._lock:
+                self._down_until.pop(id(engine), None)
+
+    def _observe(self, engine: Any, started: float) -> None:
+        if self._observer is not None:
+            self._observer(self.name_of(engine), time.perf_counter() - started)
+
+    def connect(self) -> Tuple[Any, Any]:
+        last_error: Optional[Exception] = None
+        for engine in self.candidates():
+            started = time.perf_counter()
+            try:
+                connection = engine.connect()
+            except exc.TimeoutError as e:
+                last_error = e
+                continue
+            except exc.DBAPIError as e:
+                self.mark_down(engine, e)
+                last_error = e
+                continue
+            self._observe(engine, started)
+            self.mark_up(engine)
+            return engine, connection
+        raise last_error
+
+    async def aconnect(self) -> Tuple[Any, Any]:
+        last_error: Optional[Exception] = None
+        for engine in self.candidates():
+            started = time.perf_counter()
+            try:
+                connection = await engine.connect()
+            except exc.TimeoutError as e:
+                last_error = e
+                continue
+            except exc.DBAPIError as e:
+                self.mark_down(engine, e)
+                last_error = e
+                continue
+            self._observe(engine, started)
+            self.mark_up(engine)
+            return engine, connection
+        raise last_error
+
+    def warm_up(self, min_connections: int) -> bool:
+        ready = True
+        for engine in self.engines():
+            connections = []
+            try:
+                for _ in range(min_connections):
+                    connections.append(engine.connect())
+            except Exception as e:
+                if engine is not self.primary:
+                    self.mark_down(engine, e)
+                    continue
+                logging.warning("Pool warm-up failed for %s: %s", self.name_of(engine), e)
+                ready = False
+            finally:
+                for connection in connections:
+                    connection.close()
+        return ready
+
+    async def awarm_up(self, min_connections: int) -> bool:
+        ready = True
+        for engine in self.engines():
+            connections = []
+            try:
+                for _ in range(min_connections):
+                    connections.append(await engine.connect())
+            except Exception as e:
+                if engine is not self.primary:
+                    self.mark_down(engine, e)
+                    continue
+                logging.warning("Async pool warm-up failed for %s: %s", self.name_of(engine), e)
+                ready = False
+            finally:
+                await asyncio.gather(*(connection.close() for connection in connections))
+        return ready
+
+
+def as_router(target: Any) -> EngineRouter:
+    return target if isinstance(target, EngineRouter) else EngineRouter(target)
@@ -0,0 +1,248 @@
+import os
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from app.services.cache import schema_fingerprint
+
+SNAPSHOT_VERSION = 2
+
+COLUMNS_QUERY = """
+SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, COLUMN_KEY
+FROM information_schema.COLUMNS
+WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN :tables
+ORDER BY TABLE_NAME, ORDINAL_POSITION
+"""
+
+FOREIGN_KEYS_QUERY = """
+SELECT TABLE_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME
+FROM information_schema.KEY_COLUMN_USAGE
+WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN :tables AND REFERENCED_TABLE_NAME IS NOT NULL
+"""
+
+INDEXES_QUERY = """
+SELECT TABLE_NAME, COLUMN_NAME
+FROM information_schema.STATISTICS
+WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN :tables AND SEQ_IN_INDEX = 1
+"""
+
+ROWS_QUERY = """
+SELECT TABLE_NAME, TABLE_ROWS
+FROM information_schema.TABLES
+WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN :tables
+"""
+
+
+class SchemaSnapshot(NamedTuple):
+    tables: Dict[str, Dict[str, Any]]
+    hash: str
+    source: str
+    created_at: str
+    columns: str
+
+
+def approximate_rows(rows: Optional[int]) -> Optional[int]:
+    if rows is None:
+        return None
+    rows = max(0, int(rows))
+    return round(rows, 1 - len(str(rows))) if rows >= 10 else rows
+
+
+def empty_table() -> Dict[str, Any]:
+    return {"columns": {}, "primary_key": [], "foreign_keys": {}, "indexed": [], "rows": None}
+
+
+def run_for_tables(connection: Connection, query: str, tables: Sequence[str]) -> List[Any]:
+    statement = text(query).bindparams(bindparam("tables", expanding=True))
+    return connection.execute(statement, {"tables": list(tables)}).fetchall()
+
+
+def reflect_mysql_columns(connection: Connection, tables: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    reflected: Dict[str, Dict[str, Any]] = {}
+    for table, column, data_type, key in run_for_tables(connection, COLUMNS_QUERY, tables):
+        info = reflected.setdefault(table, empty_table())
+        info["columns"][column] = data_type
+        if key == "PRI":
+            info["primary_key"].append(column)
+    return reflected
+
+
+def reflect_mysql(connection: Connection, tables: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    def run(query: str) -> List[Any]:
+        return run_for_tables(connection, query, tables)
+
+    reflected = reflect_mysql_columns(connection, tables)
+    for table, column, target, target_column in run(FOREIGN_KEYS_QUERY):
+        if table in reflected:
+            reflected[table]["foreign_keys"][column] = f"{target}.{target_column}"
+    for table, column in run(INDEXES_QUERY):
+        if table in reflected and column not in reflected[table]["indexed"]:
+            reflected[table]["indexed"].append(column)
+    for table, rows in run(ROWS_QUERY):
+        if table in reflected:
+            reflected[table]["rows"] = rows
+    return reflected
+
+
+def reflect_generic(connection: Connection, tables: Sequence[str],
+                    columns_only: bool = False) -> Dict[str, Dict[str, Any]]:
+    inspector = inspect(connection)
+    existing = set(inspector.get_table_names())
+    reflected: Dict[str, Dict[str, Any]] = {}
+    for table in tables:
+        if table not in existing:
+            continue
+        info = reflected[table] = empty_table()
+        for column in inspector.get_columns(table):
+            info["columns"][column["name"]] = str(column["type"]).lower()
+        info["primary_key"] = list(inspector.get_pk_constraint(table).get("constrained_columns") or [])
+        if columns_only:
+            continue
+        for foreign_key in inspector.get_foreign_keys(table):
+            for column, target_column in zip(foreign_key["constrained_columns"], foreign_key["referred_columns"]):
+                info["foreign_keys"][column] = f"{foreign_key['referred_table']}.{target_column}"
+        leading = info["primary_key"][:1] + [
+            index["column_names"][0] for index in inspector.get_indexes(table) if index["column_names"]
+        ]
+        info["indexed"] = list(dict.fromkeys(leading))
+    return reflected
+
+
+def reflect_schema(engine: Engine, tables: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    with engine.connect() as connection:
+        if engine.dialect.name == "mysql":
+            return reflect_mysql(connection, tables)
+        return reflect_generic(connection, tables)
+
+
+def columns_signature(reflected: Dict[str, Dict[str, Any]]) -> str:
+    return schema_fingerprint({
+        table: [info["columns"], info["primary_key"]] for table, info in sorted(reflected.items())
+    })
+
+
+def live_columns_signature(engine: Engine, tables: Sequence[str]) -> str:
+    # one information_schema query on MySQL: cheap enough to run at every startup
+    with engine.connect() as connection:
+        if engine.dialect.name == "mysql":
+            return columns_signature(reflect_mysql_columns(connection, tables))
+        return columns_signature(reflect_generic(connection, tables, columns_only=True))
+
+
+def merge_table_info(table_info: Dict[str, Dict[str, Any]], reflected: Dict[str, Dict[str, Any]],
+                     tables: Sequence[str], all_columns: bool = False) -> Dict[str, Dict[str, Any]]:
+    merged: Dict[str, Dict[str, Any]] = {}
+    for table in tables:
+        actual = reflected.get(table)
+        described = table_info.get(table, {})
+        if actual is None:
+            logging.warning("Schema snapshot: table %s not found, left out of the prompt", table)
+            continue
+        descriptions = described.get("columns", {})
+        missing = [column for column in descriptions if column not in actual["columns"]]
+        if missing:
+            logging.warning("Schema snapshot: %s has no column(s) %s", table, ", ".join(missing))
+        keys = set(actual["primary_key"]) | set(actual["foreign_keys"])
+        columns = {
+            column: descriptions.get(column) or actual["foreign_keys"].get(column) or data_type
+            for column, data_type in actual["columns"].items()
+            if all_columns or column in descriptions or column in keys
+        }
+        merged[table] = {
+            "description": described.get("description", ""),
+            "columns": columns,
+            "foreign_keys": {
+                column: target for column, target in actual["foreign_keys"].items()
+                if column in columns and columns[column] != target
+            },
+            "indexed": [column for column in actual["indexed"] if column in columns],
+            "rows": approximate_rows(actual["rows"]),
+        }
+    return merged
+
+
+def source_fingerprint(engine: Engine, table_info: Dict[str, Dict[str, Any]], tables: Sequence[str],
+                       all_columns: bool) -> str:
+    # repr() of a SQLAlchemy URL masks the password, so no credential ends up hashed or on disk
+    return schema_fingerprint(SNAPSHOT_VERSION, repr(engine.url), table_info, list(tables), all_columns)
+
+
+def static_snapshot(table_info: Dict[str, Dict[str, Any]], tables: Sequence[str]) -> SchemaSnapshot:
+    selected = {table: table_info[table] for table in tables if table in table_info}
+    return SchemaSnapshot(selected, schema_fingerprint(selected), "", "", "")
+
+
+def build_snapshot(engine: Engine, table_info: Dict[str, Dict[str, Any]], tables: Sequence[str],
+                   all_columns: bool = False) -> SchemaSnapshot:
+    reflected = reflect_schema(engine, tables)
+    if not reflected:
+        raise RuntimeError("none of the configured tables exist in the database")
+    merged = merge_table_info(table_info, reflected, tables, all_columns)
+    return SchemaSnapshot(
+        merged,
+        schema_fingerprint(merged),
+        source_fingerprint(engine, table_info, tables, all_columns),
+        datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        columns_signature(reflected),
+    )
+
+
+def save_snapshot(path: str, snapshot: SchemaSnapshot) -> None:
+    payload = {"version": SNAPSHOT_VERSION, **snapshot._asdict()}
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as handle:
+        json.dump(payload, handle, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temporary, path)
+
+
+def read_snapshot(path: str) -> Optional[SchemaSnapshot]:
+    try:
+        with open(path, encoding="utf-8") as handle:
+            payload = json.load(handle)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning("Schema snapshot %s unreadable: %s", path, e)
+        return None
+    if payload.get("version") != SNAPSHOT_VERSION:
+        return None
+    snapshot = SchemaSnapshot(
+        payload["tables"], payload["hash"], payload["source"], payload["created_at"], payload["columns"]
+    )
+    if schema_fingerprint(snapshot.tables) != snapshot.hash:
+        logging.warning("Schema snapshot %s does not match its hash, ignoring it", path)
+        return None
+    return snapshot
+
+
+def load_schema_snapshot(engine: Engine, table_info: Dict[str, Dict[str, Any]], path: str,
+                         tables: Sequence[str], all_columns: bool = False, refresh: bool = False,
+                         fallback: Optional[SchemaSnapshot] = None) -> SchemaSnapshot:
+    if not refresh:
+        snapshot = read_snapshot(path)
+        if snapshot is not None and snapshot.source == source_fingerprint(engine, table_info, tables, all_columns):
+            try:
+                current = live_columns_signature(engine, tables)
+            except Exception as e:
+                logging.warning("Schema check failed, using snapshot %s from %s unverified: %s", snapshot.hash, path, e)
+                return snapshot
+            if current == snapshot.columns:
+                logging.info("Schema snapshot %s loaded from %s", snapshot.hash, path)
+                return snapshot
+            logging.info("Schema snapshot %s is stale (columns changed), rebuilding it", snapshot.hash)
+    try:
+        snapshot = build_snapshot(engine, table_info, tables, all_columns)
+    except Exception as e:
+        if fallback is not None:
+            logging.warning("Schema introspection failed, keeping snapshot %s: %s", fallback.hash, e)
+            return fallback
+        logging.warning("Schema introspection failed, using the static table_info: %s", e)
+        return static_snapshot(table_info, tables)
+    try:
+        save_snapshot(path, snapshot)
+    except OSError as e:
+        logging.warning("Schema snapshot could not be written to %s: %s", path, e)
+    logging.info("Schema snapshot %s built for %d tables", snapshot.hash, len(snapshot.tables))
+    return snapshot
@@ -0,0 +1,314 @@
+import re
+import hashlib
+import logging
+from typing import List, Optional, Tuple
+from app.services.cache import TTLCache
+
+FENCE_PATTERN = re.compile(r"```[A-Za-z]*[ \t]*\n?(.*?)(?:```|$)", re.S)
+
+TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+    |(?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    |(?P<ident>`(?:[^`]|``)*`)
+    |(?P<unterminated>['"`].*|/\*.*)
+    |(?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    |(?P<number>\d+(?:\.\d+)?)
+    |(?P<space>\s+)
+    |(?P<semi>;)
+    |(?P<open>\()
+    |(?P<close>\))
+    |(?P<other>.)
+    """,
+    re.S | re.X,
+)
+
+READ_ONLY_STARTS = {"SELECT", "WITH"}
+FORBIDDEN_WORDS = {
+    "INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "CREATE", "TRUNCATE", "RENAME",
+    "GRANT", "REVOKE", "LOCK", "UNLOCK", "CALL", "LOAD", "HANDLER", "INTO", "SET",
+    "COMMIT", "ROLLBACK", "KILL", "SHUTDOWN", "EXECUTE", "PREPARE", "DEALLOCATE",
+}
+
+# words that end a FROM list item, so they are never taken for a table alias
+CLAUSE_WORDS = {
+    "WHERE", "JOIN", "INNER", "LEFT", "RIGHT", "CROSS", "NATURAL", "STRAIGHT_JOIN", "FULL", "OUTER",
+    "ON", "USING", "GROUP", "ORDER", "LIMIT", "HAVING", "UNION", "EXCEPT", "INTERSECT", "WINDOW",
+    "FOR", "LATERAL", "PARTITION", "USE", "FORCE", "IGNORE", "INTO",
+}
+
+# functions whose arguments use FROM without naming a table
+FROM_FUNCTIONS = {"EXTRACT", "TRIM", "SUBSTRING", "SUBSTR", "POSITION"}
+
+Token = Tuple[str, str, int]
+
+_parse_cache = TTLCache(max_size=2048)
+
+
+class SQLValidationError(ValueError):
+    pass
+
+
+def strip_fences(output: str) -> str:
+    if "```" not in output:
+        return output
+    blocks = [block for block in FENCE_PATTERN.findall(output) if block.strip()]
+    return "\n".join(blocks) if blocks else output.replace("```", " ")
+
+
+def tokenize(sql: str) -> List[List[Token]]:
+    statements: List[List[Token]] = []
+    current: List[Token] = []
+    depth = 0
+    for match in TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        value = match.group()
+        if kind == "comment":
+            kind, value = "space", " "
+        if kind == "semi":
+            if current:
+                statements.append(current)
+            current, depth = [], 0
+            continue
+        if kind == "close":
+            depth = max(depth - 1, 0)
+        current.append((kind, value, depth))
+        if kind == "open":
+            depth += 1
+    if current:
+        statements.append(current)
+    return statements
+
+
+def starts_cte(tokens: List[Token], index: int) -> bool:
+    # WITH only opens a statement as "WITH RECURSIVE" or "WITH name [(columns)] AS (", not in prose
+    name = next_significant(tokens, index)
+    if name >= len(tokens) or tokens[name][0] not in ("word", "ident"):
+        return False
+    if tokens[name][1].upper() == "RECURSIVE":
+        return True
+    following = next_significant(tokens, name)
+    if following < len(tokens) and tokens[following][0] == "open":
+        depth = tokens[following][2]
+        while following < len(tokens) and not (tokens[following][0] == "close" and tokens[following][2] == depth):
+            following += 1
+        following = next_significant(tokens, following)
+    if following >= len(tokens) or tokens[following][1].upper() != "AS":
+        return False
+    body = next_significant(tokens, following)
+    return body < len(tokens) and tokens[body][0] == "open"
+
+
+def find_start(tokens: List[Token]) -> int:
+    candidates = [
+        index for index, (kind, value, _) in enumerate(tokens)
+        if kind == "word" and value.upper() in READ_ONLY_STARTS
+        and (value.upper() != "WITH" or starts_cte(tokens, index))
+    ]
+    if not candidates:
+        return -1
+    start = candidates[0]
+    for index in candidates:
+        previous = tokens[index - 1] if index else None
+        if previous is None or (previous[0] == "space" and "\n" in previous[1]):
+            start = index
+            break
+    while start > 0 and tokens[start - 1][0] in ("open", "space"):
+        start -= 1
+    while tokens[start][0] == "space":
+        start += 1
+    return start
+
+
+def next_significant(tokens: List[Token], index: int) -> int:
+    index += 1
+    while index < len(tokens) and tokens[index][0] == "space":
+        index += 1
+    return index
+
+
+def check_read_only(tokens: List[Token]) -> None:
+    for index, (kind, value, _) in enumerate(tokens):
+        if kind != "word":
+            continue
+        word = value.upper()
+        following = next_significant(tokens, index)
+        following_token = tokens[following] if following < len(tokens) else None
+        if word == "FOR" and following_token and following_token[1].upper() in ("UPDATE", "SHARE"):
+            raise SQLValidationError("Locking reads are not allowed")
+        if word == "REPLACE" and not (following_token and following_token[0] == "open"):
+            raise SQLValidationError("REPLACE statements are not allowed")
+        if word == "SET" and index >= 2 and tokens[index - 2][1].upper() == "CHARACTER":
+            continue
+        if word in FORBIDDEN_WORDS:
+            raise SQLValidationError(f"Statement contains forbidden keyword {word}")
+
+
+def apply_limit(tokens: List[Token], max_limit: int) -> List[Token]:
+    base_depth = tokens[0][2]
+    limit_index = -1
+    for index, (kind, value, depth) in enumerate(tokens):
+        if kind == "word" and depth == base_depth and value.upper() == "LIMIT":
+            limit_index = index
+    if limit_index < 0:
+        return tokens + [("space", " ", base_depth), ("word", "LIMIT", base_depth),
+                         ("space", " ", base_depth), ("number", str(max_limit), base_depth)]
+
+    first = next_significant(tokens, limit_index)
+    count = first
+    separator = next_significant(tokens, first)
+    if separator < len(tokens) and tokens[separator][1] == ",":
+        count = next_significant(tokens, separator)
+    if count >= len(tokens):
+        return tokens[:limit_index] + [("word", "LIMIT", base_depth), ("space", " ", base_depth),
+                                       ("number", str(max_limit), base_depth)]
+    kind, value, depth = tokens[count]
+    if kind != "number" or float(value) > max_limit:
+        tokens = tokens[:count] + [("number", str(max_limit), depth)] + tokens[count + 1:]
+    return tokens
+
+
+def render(tokens: List[Token]) -> str:
+    parts = []
+    for kind, value, _ in tokens:
+        if kind == "space":
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+        else:
+            parts.append(value)
+    return "".join(parts).strip()
+
+
+def check_well_formed(tokens: List[Token]) -> None:
+    balance = 0
+    for kind, _, _ in tokens:
+        if kind == "unterminated":
+            raise SQLValidationError("Unterminated string, identifier or comment")
+        balance += (kind == "open") - (kind == "close")
+        if balance < 0:
+            break
+    if balance:
+        raise SQLValidationError("Unbalanced parentheses")
+
+
+def parse_statement(tokens: List[Token], max_limit: Optional[int]) -> Optional[str]:
+    start = find_start(tokens)
+    if start < 0:
+        return None
+    tokens = tokens[start:]
+    while tokens and tokens[-1][0] == "space":
+        tokens = tokens[:-1]
+    check_well_formed(tokens)
+    check_read_only(tokens)
+    if max_limit is not None:
+        tokens = apply_limit(tokens, max_limit)
+    return render(tokens) + ";"
+
+
+def parse_queries(output: str, max_limit: Optional[int]) -> List[str]:
+    queries = []
+    for tokens in tokenize(strip_fences(output)):
+        try:
+            query = parse_statement(tokens, max_limit)
+        except SQLValidationError as e:
+            logging.warning("Rejected generated statement: %s", e)
+            continue
+        if query:
+            queries.append(query)
+    return queries
+
+
+def is_bound(previous: List[str], between: bool) -> bool:
+    # LIMIT/OFFSET counts and range comparisons change row estimates, equality literals mostly do not
+    if not previous:
+        return False
+    last = previous[-1]
+    if last in ("LIMIT", "OFFSET", "BETWEEN", "<", ">") or (last == "AND" and between):
+        return True
+    if last == "=" and len(previous) > 1 and previous[-2] in ("<", ">", "!"):
+        return True
+    return last == "," and len(previous) > 2 and previous[-3] == "LIMIT"
+
+
+def normalize_query(sql: str, keep_bounds: bool = False) -> str:
+    parts = []
+    previous: List[str] = []
+    between = False
+    for match in TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        value = match.group()
+        if kind in ("comment", "space"):
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+            continue
+        if kind in ("string", "number"):
+            kept = keep_bounds and is_bound(previous, between)
+            parts.append(value if kept else "?")
+            between = between and previous[-1:] == ["BETWEEN"]
+        elif kind == "word":
+            value = value.upper()
+            between = between or value == "BETWEEN"
+            parts.append(value)
+        elif kind != "semi":
+            parts.append(value)
+        previous.append(value)
+    return "".join(parts).strip()
+
+
+def table_name(value: str) -> str:
+    return value[1:-1].replace("``", "`") if value.startswith("`") else value
+
+
+def read_table_list(tokens: List[Token], index: int, tables: List[str]) -> None:
+    while index < len(tokens):
+        kind, value, depth = tokens[index]
+        if kind == "open":
+            # derived table: its own FROM clauses are read separately, skip to the alias
+            index += 1
+            while index < len(tokens) and not (tokens[index][0] == "close" and tokens[index][2] == depth):
+                index += 1
+            index += 1
+        elif kind in ("word", "ident") and value.upper() not in CLAUSE_WORDS:
+            name = value
+            index += 1
+            while index + 1 < len(tokens) and tokens[index][1] == "." and tokens[index + 1][0] in ("word", "ident"):
+                name = tokens[index + 1][1]
+                index += 2
+            tables.append(table_name(name).lower())
+        else:
+            return
+        if index < len(tokens) and tokens[index][1].upper() == "AS":
+            index += 1
+        if index < len(tokens) and tokens[index][0] in ("word", "ident") and tokens[index][1].upper() not in CLAUSE_WORDS:
+            index += 1
+        if index >= len(tokens) or tokens[index][1] != ",":
+            return
+        index += 1
+
+
+def in_from_function(tokens: List[Token], index: int) -> bool:
+    depth = tokens[index][2]
+    while index > 0:
+        index -= 1
+        if tokens[index][0] == "open" and tokens[index][2] < depth:
+            return index > 0 and tokens[index - 1][1].upper() in FROM_FUNCTIONS
+    return False
+
+
+def referenced_tables(sql: str) -> List[str]:
+    tables: List[str] = []
+    for statement in tokenize(sql):
+        tokens = [token for token in statement if token[0] != "space"]
+        for index, (kind, value, _) in enumerate(tokens):
+            if kind == "word" and value.upper() in ("FROM", "JOIN") and not in_from_function(tokens, index):
+                read_table_list(tokens, index + 1, tables)
+    return list(dict.fromkeys(tables))
+
+
+def extract_queries(output: str, max_limit: Optional[int]) -> List[str]:
+    key = (hashlib.blake2b(output.encode("utf-8"), digest_size=16).digest(), max_limit)
+    cached = _parse_cache.get(key)
+    if cached is None:
+        cached = tuple(parse_queries(output, max_limit))
+        _parse_cache.set(key, cached)
+    return list(cached)
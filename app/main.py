@@ -1,21 +1,62 @@
-import time
+import os
+import json
+import asyncio
 import logging
+from typing import Any, Awaitable, Callable, Optional
 from dotenv import load_dotenv
 from fastapi import FastAPI, Response
 from starlette.concurrency import run_in_threadpool
-from app.schemas.question import Question
-from app.services.factories import set_sql_agent, set_nlp_agent
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from app.schemas.question import Question, BatchQuestions
+from app.services.factories import (
+    set_agents,
+    get_llm_http_clients,
+    set_sql_cache,
+    set_result_cache,
+    set_schema_index,
+    set_schema_snapshot,
+    set_session_expiry,
+    set_read_router,
+    set_coalescer,
+    set_intent_router,
+    set_answer_formatter,
+    set_admission,
+    set_cost_guard,
+)
 from app.db.database import (
     create_engine_for_sql_database,
-    verify_and_extract_sql_query,
-    execute_queries,
-    is_empty_result,
+    create_async_engine_for_sql_database,
+)
+from app.services.agents import install_agents, pin_agents
+from app.services.admission import BATCH, Overloaded, llm_slot
+from app.services.metrics import PipelineMetrics, RequestTimings, register_state_collectors
+from app.services.pipeline import (
+    generate_queries,
+    fetch_checked_data,
+    nlp_variables,
+    rotate_memories,
+    sync_memories,
+    warm_up_pools,
+    resolve_data,
+    generate_queries_batch,
+    batch_waves,
+    format_answer,
+)
+from app.tasks.jobs import (
+    reset_agents_memory,
+    check_last_request_per_user,
+    reset_llm,
+    refresh_result_cache_watermarks,
+    refresh_intent_index,
+    refresh_schema_snapshot,
 )
-from app.tasks.jobs import reset_agents_memory, check_last_request_per_user, reset_llm
 from app.tasks.scheduler import (
     create_scheduler,
     add_memory_check_job,
     add_llm_reset_job,
+    add_watermark_refresh_job,
+    add_intent_index_refresh_job,
+    add_schema_snapshot_refresh_job,
     start_scheduler,
     stop_scheduler,
 )
@@ -35,7 +76,10 @@ def initialize_app():
     )
 
     async def startup_event():
-        app.state.last_request_per_user = {}
+        app.state.session_expiry = set_session_expiry()
+        app.state.admission = set_admission()
+        app.state.metrics = PipelineMetrics()
+        register_state_collectors(app.state.metrics, app.state)
         logging.info("Application startup initiated...")
         try:
             engine = create_engine_for_sql_database("mysql+pymysql:")
@@ -43,13 +87,52 @@ def initialize_app():
             logging.exception("Database engine initialization failed: %s", e)
             raise RuntimeError("Cannot initialize database engine") from e
 
-        app.state.sql_agent = set_sql_agent(engine)
-        app.state.nlp_agent = set_nlp_agent()
+        async_engine = None
+        if os.getenv("DB_ASYNC", "1") == "1":
+            try:
+                async_engine = create_async_engine_for_sql_database(
+                    os.getenv("DB_ASYNC_DRIVER", "mysql+aiomysql:")
+                )
+            except Exception as e:
+                logging.warning("Async database engine unavailable, using threadpool: %s", e)
+
+        app.state.ready = False
+        app.state.read_router = set_read_router(engine)
+        app.state.async_read_router = (
+            set_read_router(async_engine, "DB_ASYNC_REPLICA_URLS", is_async=True)
+            if async_engine is not None else None
+        )
+        app.state.metrics.observe_checkouts(app.state.read_router, "sync")
+        if app.state.async_read_router is not None:
+            app.state.metrics.observe_checkouts(app.state.async_read_router, "async")
+        install_agents(app.state, set_agents(engine, async_engine, limiter=app.state.admission.llm))
+        app.state.schema_snapshot = await run_in_threadpool(set_schema_snapshot, engine)
+        app.state.sql_cache = set_sql_cache(app.state.schema_snapshot)
+        app.state.result_cache = set_result_cache()
+        app.state.schema_index = set_schema_index(app.state.schema_snapshot)
+        app.state.coalescer = set_coalescer()
+        app.state.intent_router = set_intent_router()
+        app.state.answer_formatter = set_answer_formatter(app.state.schema_snapshot)
+        app.state.cost_guard = set_cost_guard()
 
         try:
             sched = create_scheduler()
-            add_memory_check_job(sched, check_last_request_per_user, app, 1)
+            add_memory_check_job(
+                sched, check_last_request_per_user, app,
+                int(os.getenv("MEMORY_CHECK_INTERVAL_SECONDS", "10")),
+            )
             add_llm_reset_job(sched, reset_llm, app)
+            watermark_interval = int(os.getenv("RESULT_CACHE_WATERMARK_SECONDS", "15"))
+            if watermark_interval > 0:
+                add_watermark_refresh_job(sched, refresh_result_cache_watermarks, app, watermark_interval)
+            if app.state.intent_router is not None:
+                add_intent_index_refresh_job(
+                    sched, refresh_intent_index, app,
+                    int(os.getenv("INTENT_INDEX_REFRESH_SECONDS", "600")),
+                )
+            schema_interval = int(os.getenv("SCHEMA_SNAPSHOT_REFRESH_SECONDS", "3600"))
+            if schema_interval > 0:
+                add_schema_snapshot_refresh_job(sched, refresh_schema_snapshot, app, schema_interval)
             await start_scheduler(sched)
             app.state._scheduler = sched
             logging.info("Scheduler initialized successfully")
@@ -57,6 +140,11 @@ def initialize_app():
             logging.exception("Failed to initialize scheduler: %s", e)
             raise RuntimeError("Scheduler initialization failed") from e
 
+        app.state.ready = await warm_up_pools(app.state)
+        await run_in_threadpool(refresh_intent_index, app)
+        if not app.state.ready:
+            logging.warning("Database pool warm-up incomplete; /ready will retry")
+
     async def shutdown_event():
         try:
             sched = getattr(app.state, "_scheduler", None)
@@ -64,6 +152,20 @@ def initialize_app():
                 stop_scheduler(sched)
         except Exception as e:
             logging.error("Error stopping scheduler: %s", e)
+        try:
+            for engine in app.state.read_router.engines():
+                engine.dispose()
+            if app.state.async_read_router is not None:
+                for engine in app.state.async_read_router.engines():
+                    await engine.dispose()
+        except Exception as e:
+            logging.error("Error disposing database engines: %s", e)
+        try:
+            http_client, http_async_client = get_llm_http_clients()
+            http_client.close()
+            await http_async_client.aclose()
+        except Exception as e:
+            logging.error("Error closing LLM HTTP clients: %s", e)
         try:
             reset_agents_memory(app)
         except Exception as e:
@@ -71,72 +173,326 @@ def initialize_app():
 
         logging.info("Shutdown complete.")
 
+    async def overloaded_handler(request, error: Overloaded):
+        logging.warning("Request shed: %s", error)
+        return JSONResponse(
+            status_code=429,
+            content={"status": "error", "response": "Service saturé, veuillez réessayer dans quelques instants."},
+            headers={"Retry-After": str(error.retry_after)},
+        )
+
     app.add_event_handler("startup", startup_event)
     app.add_event_handler("shutdown", shutdown_event)
+    app.add_exception_handler(Overloaded, overloaded_handler)
 
     return app
 
 app = initialize_app()
 
+class SessionStreamingResponse(StreamingResponse):
+    # releases the session slot even when the client leaves before the body generator starts
+    def __init__(self, content: Any, release: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.body_iterator.aclose()
+            finally:
+                self._release()
+
+def sse_event(event: str, payload: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+def finish_request(endpoint: str, status: str, timings: RequestTimings) -> None:
+    app.state.metrics.requests.inc(endpoint=endpoint, status=status)
+    app.state.metrics.request_seconds.observe(timings.elapsed(), endpoint=endpoint, status=status)
+
+@app.get("/ready")
+async def get_readiness():
+    if not app.state.ready:
+        app.state.ready = await warm_up_pools(app.state)
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(
+        app.state.metrics.registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
 @app.post("/predict")
 async def get_ai_response(question: Question, response: Response):
+    state = pin_agents(app.state)
     session_id = question.session_id
     user_question = question.question
-    max_result_limit = 50
-    
-    app.state.last_request_per_user[session_id] = int(time.time())
+    timings = RequestTimings(state.metrics)
+    status = "error"
     try:
-        sql_result = await run_in_threadpool(
-            lambda: app.state.sql_agent.get_response_with_memory(session_id, user_question)
-        )
-        queries = verify_and_extract_sql_query(sql_result.content, max_result_limit)
-        data = await run_in_threadpool(
-            lambda: execute_queries(app.state.sql_agent.get_engine(), queries)
-        )
-        if is_empty_result(data):
-            data = {"result": "no matching item"}
-
-        final_response = await run_in_threadpool(
-            lambda: app.state.nlp_agent.get_response_with_memory(
-                session_id=session_id,
-                user_question=user_question,
-                dynamic_variables={
-                    "query": queries,
-                    "data": str(data),
-                    "result_limit": max_result_limit,
-                },
-            )
-        )
-        app.state.sql_agent.get_memory().rotate_history(session_id, max_questions=3)
-        app.state.nlp_agent.get_memory().rotate_history(session_id, max_questions=3)
+        state.admission.check()
+        async with state.admission.sessions.hold(session_id):
+            with state.session_expiry.track(session_id):
+                await sync_memories(state, session_id, "load_session")
+                try:
+                    result = await answer_question(state, session_id, user_question, response, timings)
+                finally:
+                    await sync_memories(state, session_id, "flush")
+        status = result["status"]
+    except Overloaded:
+        status = "overloaded"
+        raise
+    finally:
+        finish_request("predict", status, timings)
+    response.headers["Server-Timing"] = timings.server_timing()
+    return result
+
+async def answer_question(state: Any, session_id: int, user_question: str, response: Response,
+                          timings: RequestTimings, resolve: Optional[Callable[[], Awaitable[tuple]]] = None):
+    try:
+        if resolve is None:
+            queries, data = await resolve_data(state, session_id, user_question, timings)
+        else:
+            queries, data = await resolve()
+
+        answer = format_answer(state, session_id, user_question, data, timings)
+        if answer is None:
+            async with llm_slot(state):
+                with timings.stage("nlp_generation"):
+                    final_response = await state.nlp_agent.aget_response_with_memory(
+                        session_id=session_id,
+                        user_question=user_question,
+                        dynamic_variables=nlp_variables(state, queries, data),
+                    )
+            state.metrics.record_tokens("nlp", final_response)
+            timings.record_attempts(final_response)
+            answer = str(final_response.content)
+        rotate_memories(state, session_id, timings)
         return {
             "status": "success",
-            "response": str(final_response.content),
+            "response": answer,
         }
 
+    except Overloaded:
+        raise
     except Exception as e:
         logging.exception("Error processing request for session %s: %s", session_id, e)
+        timings.record_attempts(e)
         try:
-            error_response = await run_in_threadpool(
-                lambda: app.state.nlp_agent.get_response_with_memory(
-                    session_id=session_id,
-                    user_question=user_question,
-                    dynamic_variables={
-                        "query": queries if 'queries' in locals() else ["No query generated"],
-                        "data": str(e),
-                        "result_limit": max_result_limit,
-                    },
-                )
-            )
+            async with llm_slot(state):
+                with timings.stage("nlp_error_generation"):
+                    error_response = await state.nlp_agent.aget_response_with_memory(
+                        session_id=session_id,
+                        user_question=user_question,
+                        dynamic_variables=nlp_variables(
+                            state, queries if 'queries' in locals() else ["No query generated"], str(e)
+                        ),
+                    )
+            state.metrics.record_tokens("nlp", error_response)
+            timings.record_attempts(error_response)
             response.status_code = 200
             return {
                 "status": "success",
                 "response": str(error_response.content),
             }
+        except Overloaded:
+            raise
         except Exception as nlp_error:
             logging.exception("NLP agent error after SQL failure: %s", nlp_error)
             response.status_code = 500
             return {
                 "status": "error",
                 "response": "Internal server error. Please retry later.",
-            }
\ No newline at end of file
+            }
+
+@app.post("/predict/batch")
+async def batch_ai_response(batch: BatchQuestions):
+    max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+    concurrency = batch.concurrency or int(os.getenv("BATCH_CONCURRENCY", "4"))
+    concurrency = max(1, min(concurrency, max_concurrency))
+    app.state.admission.check()
+    return StreamingResponse(
+        answer_batch(pin_agents(app.state, BATCH), batch.questions, concurrency),
+        media_type="application/x-ndjson",
+    )
+
+async def answer_batch(state: Any, questions: list[Question], concurrency: int):
+    results: asyncio.Queue = asyncio.Queue()
+    producer = asyncio.create_task(run_batch(state, questions, concurrency, results))
+
+    def on_done(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            results.put_nowait(task.exception())
+
+    producer.add_done_callback(on_done)
+    try:
+        for _ in range(len(questions)):
+            item = await results.get()
+            if isinstance(item, Exception):
+                logging.error("Batch aborted: %s", item)
+                raise item
+            yield json.dumps(item, ensure_ascii=False, default=str) + "\n"
+    finally:
+        producer.cancel()
+
+async def run_batch(state: Any, questions: list[Question], concurrency: int, results: asyncio.Queue):
+    semaphore = asyncio.Semaphore(concurrency)
+    for wave in batch_waves(questions):
+        tasks = []
+        for start in range(0, len(wave), concurrency):
+            chunk = wave[start:start + concurrency]
+            timings = [RequestTimings(state.metrics) for _ in chunk]
+            held = []
+            try:
+                # one global lock order: batches sharing sessions cannot each hold what the other waits for
+                for session_id in sorted(question.session_id for _, question in chunk):
+                    await state.admission.sessions.acquire(session_id, bounded=False)
+                    held.append(session_id)
+                    state.session_expiry.begin(session_id)
+                for _, question in chunk:
+                    await sync_memories(state, question.session_id, "load_session")
+                prepared = await generate_queries_batch(
+                    state,
+                    [(question.session_id, question.question) for _, question in chunk],
+                    timings,
+                    concurrency,
+                )
+            except Exception as e:
+                prepared = [e] * len(chunk)
+            except BaseException:
+                for session_id in held:
+                    state.session_expiry.end(session_id)
+                    state.admission.sessions.release(session_id)
+                raise
+            for (index, question), item_timings, item in zip(chunk, timings, prepared):
+                tasks.append(asyncio.create_task(
+                    answer_batch_item(state, index, question, item_timings, item, semaphore, results)
+                ))
+        await asyncio.gather(*tasks)
+
+async def answer_batch_item(state: Any, index: int, question: Question, timings: RequestTimings,
+                            prepared: Any, semaphore: asyncio.Semaphore, results: asyncio.Queue):
+    async def resolve():
+        if isinstance(prepared, Exception):
+            raise prepared
+        queries, _, data = await fetch_checked_data(state, question.session_id, question.question, prepared, timings)
+        return queries, data
+
+    session_id = question.session_id
+    extra = {}
+    try:
+        async with semaphore:
+            result = await answer_question(state, session_id, question.question, Response(), timings, resolve)
+    except Overloaded as e:
+        result = {"status": "overloaded", "response": str(e)}
+        extra = {"retry_after": e.retry_after}
+    finally:
+        await sync_memories(state, session_id, "flush")
+        state.session_expiry.end(session_id)
+        state.admission.sessions.release(session_id)
+    finish_request("predict_batch", result["status"], timings)
+    await results.put({
+        "index": index,
+        "session_id": session_id,
+        **result,
+        **extra,
+        "timings_ms": timings.as_milliseconds(),
+        "llm_attempts": timings.attempts,
+    })
+
+@app.post("/predict/stream")
+async def stream_ai_response(question: Question):
+    state = pin_agents(app.state)
+    session_id = question.session_id
+    user_question = question.question
+    timings = RequestTimings(state.metrics)
+    try:
+        state.admission.check()
+        # taken before the response starts so a rejected session still gets a 429, not a broken stream
+        await state.admission.sessions.acquire(session_id)
+    except Overloaded:
+        finish_request("predict_stream", "overloaded", timings)
+        raise
+
+    async def event_stream():
+        with state.session_expiry.track(session_id):
+            await sync_memories(state, session_id, "load_session")
+            status = "error"
+            events = answer_question_stream(state, session_id, user_question, timings)
+            try:
+                async for event, payload in events:
+                    if event == "done":
+                        status = payload["status"]
+                        payload["timings_ms"] = timings.as_milliseconds()
+                        payload["llm_attempts"] = timings.attempts
+                    yield sse_event(event, payload)
+            finally:
+                await events.aclose()
+                await sync_memories(state, session_id, "flush")
+                finish_request("predict_stream", status, timings)
+
+    return SessionStreamingResponse(
+        event_stream(),
+        lambda: state.admission.sessions.release(session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def answer_question_stream(state: Any, session_id: int, user_question: str, timings: RequestTimings):
+    queries = ["No query generated"]
+    failed = False
+    try:
+        prepared = await generate_queries(state, session_id, user_question, timings)
+        queries = prepared[0]
+        yield "stage", {"stage": "sql_generated", "queries": len(queries)}
+        queries, _, data = await fetch_checked_data(state, session_id, user_question, prepared, timings)
+        yield "stage", {"stage": "data_fetched"}
+    except Overloaded as e:
+        yield "error", {"status": "overloaded", "response": str(e), "retry_after": e.retry_after}
+        return
+    except Exception as e:
+        logging.exception("Error processing request for session %s: %s", session_id, e)
+        timings.record_attempts(e)
+        failed = True
+        data = str(e)
+
+    formatted = None if failed else format_answer(state, session_id, user_question, data, timings)
+    if formatted is not None:
+        yield "token", {"text": formatted}
+        rotate_memories(state, session_id, timings)
+        yield "done", {"status": "success", "response": formatted}
+        return
+
+    answer = []
+    tokens = state.nlp_agent.astream_response_with_memory(
+        session_id=session_id,
+        user_question=user_question,
+        dynamic_variables=nlp_variables(state, queries, data),
+    )
+    try:
+        async with llm_slot(state):
+            with timings.stage("nlp_generation"):
+                try:
+                    async for token in tokens:
+                        answer.append(token)
+                        yield "token", {"text": token}
+                finally:
+                    await tokens.aclose()
+    except Overloaded as e:
+        yield "error", {"status": "overloaded", "response": str(e), "retry_after": e.retry_after}
+        return
+    except Exception as nlp_error:
+        logging.exception("NLP agent error while streaming: %s", nlp_error)
+        timings.record_attempts(nlp_error)
+        yield "error", {
+            "status": "error",
+            "response": "Internal server error. Please retry later.",
+        }
+        return
+    if not failed:
+        rotate_memories(state, session_id, timings)
+    yield "done", {"status": "success", "response": "".join(answer)}
@@ -0,0 +1,63 @@
+column_labels = {
+    "id": ("identifiant", "m"),
+    "code": ("code", "m"),
+    "name": ("nom", "m"),
+    "category_id": ("catégorie", "f"),
+    "brand_id": ("marque", "f"),
+    "cost_price": ("prix de revient", "m"),
+    "sale_price": ("prix de vente", "m"),
+    "stock_min": ("stock minimum", "m"),
+    "stock_max": ("stock maximum", "m"),
+    "location": ("emplacement", "m"),
+    "is_active": ("actif", "m"),
+    "item_id": ("article", "m"),
+    "store_id": ("magasin", "m"),
+    "quantity": ("quantité", "f"),
+    "min_quantity": ("seuil minimum", "m"),
+    "max_quantity": ("seuil maximum", "m"),
+    "type": ("type", "m"),
+    "reference": ("référence", "f"),
+    "note": ("note", "f"),
+    "created_at": ("date", "f"),
+    "article_code": ("code article", "m"),
+    "delivered_quantity": ("quantité livrée", "f"),
+    "returned_quantity": ("quantité retournée", "f"),
+    "unit_price_ht": ("prix unitaire HT", "m"),
+    "unit_price_ttc": ("prix unitaire TTC", "m"),
+    "remise": ("remise", "f"),
+    "total_ligne_ht": ("total HT de la ligne", "m"),
+    "total_ligne_ttc": ("total TTC de la ligne", "m"),
+    "numdoc": ("numéro de document", "m"),
+    "delivery_date": ("date de livraison", "f"),
+    "invoice_date": ("date de facture", "f"),
+    "return_date": ("date de retour", "f"),
+    "status": ("statut", "m"),
+    "status_livraison": ("statut logistique", "m"),
+    "total_delivered": ("quantité totale livrée", "f"),
+    "total_ht": ("total HT", "m"),
+    "total_ttc": ("total TTC", "m"),
+    "tva_rate": ("taux de TVA", "m"),
+    "invoiced": ("facturé", "m"),
+    "paid": ("payé", "m"),
+    "vendeur": ("vendeur", "m"),
+    "vehicle_id": ("véhicule", "m"),
+    "reason": ("motif", "m"),
+    "solde": ("solde", "m"),
+    "plafond": ("plafond de crédit", "m"),
+    "risque": ("niveau de risque", "m"),
+    "blocked": ("bloqué", "m"),
+    "brand_name": ("marque", "f"),
+    "model_name": ("modèle", "m"),
+    "engine_description": ("motorisation", "f"),
+    "license_plate": ("immatriculation", "f"),
+    "city": ("ville", "f"),
+    "country": ("pays", "m"),
+    "total": ("total", "m"),
+    "montant": ("montant", "m"),
+    "stock": ("stock", "m"),
+}
+
+subject_columns = {
+    "name": ("name", "brand_name", "model_name"),
+    "code": ("code", "article_code", "numdoc", "license_plate"),
+}
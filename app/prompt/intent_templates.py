@@ -0,0 +1,80 @@
+STOCK_WORDS = ["stock", "article", "produit", "item", "piece", "reference", "actuellement", "actuel", "current"]
+
+# prefixes of words asking about something other than the current quantity / balance
+STOCK_EXCLUDE = [
+    "min", "max", "seuil", "valeur", "value", "prix", "price", "cout", "cost", "retour", "return", "vendu",
+    "vente", "sold", "sale", "achat", "achet", "mouvement", "movement", "histori", "entree", "sortie",
+    "livr", "deliver", "factur", "invoice", "moyen", "average", "evolution",
+]
+
+LIST_WORDS = [
+    "liste", "lister", "affiche", "afficher", "montre", "montrer", "donne", "donner", "voir", "tous", "toutes",
+    "quel", "quels", "quelle", "quelles", "sont", "ont", "ya", "svp", "please", "which", "items", "products",
+]
+
+intent_templates = {
+    "out_of_stock": {
+        "patterns": [r"\brupture", r"\bepuise", r"\bout of stock\b", r"\bplus (de|en) stock\b", r"\bstock (nul|a zero|vide)\b"],
+        "vocabulary": STOCK_WORDS + LIST_WORDS + ["rupture", "epuise", "out", "plus", "nul", "zero", "vide"],
+        "exclude": STOCK_EXCLUDE,
+        "slot": None,
+        "sql": "SELECT i.code, i.name, s.store_id, s.quantity FROM items i "
+               "JOIN stocks s ON s.item_id = i.id "
+               "WHERE i.is_active = 1 AND s.quantity <= 0 "
+               "ORDER BY s.quantity, i.code LIMIT :limit;",
+    },
+    "out_of_stock_by_brand": {
+        "patterns": [r"\brupture", r"\bepuise", r"\bout of stock\b", r"\bplus (de|en) stock\b", r"\bstock (nul|a zero|vide)\b"],
+        "vocabulary": STOCK_WORDS + LIST_WORDS + ["rupture", "epuise", "out", "plus", "nul", "zero", "vide", "marque", "brand"],
+        "exclude": STOCK_EXCLUDE,
+        "slot": "brand",
+        "sql": "SELECT i.code, i.name, s.store_id, s.quantity FROM items i "
+               "JOIN stocks s ON s.item_id = i.id "
+               "WHERE i.is_active = 1 AND s.quantity <= 0 AND i.brand_id = :brand_id "
+               "ORDER BY s.quantity, i.code LIMIT :limit;",
+    },
+    "below_min_stock": {
+        "patterns": [r"\b(sous|en dessous|inferieur)\w* (du |le |au )?(stock |seuil )?min", r"\bstock min",
+                     r"\bbelow min", r"\breapprovision",
+                     r"\b(dois|doit|faut|should|need)( \w+){0,3} (acheter|commander|reapprovisionner|buy|order|reorder)\b",
+                     r"\b(quoi|what) (acheter|commander|to buy|to order|to reorder)\b",
+                     r"\b(articles?|produits?|items?|products?) (a|to) (acheter|commander|buy|order|reorder)\b"],
+        "vocabulary": STOCK_WORDS + LIST_WORDS + [
+            "sous", "dessous", "inferieur", "minimum", "min", "seuil", "below", "reapprovisionner", "acheter",
+            "commander", "buy", "order", "dois", "doit", "faut", "should", "je", "i", "quoi", "what",
+        ],
+        "exclude": STOCK_EXCLUDE,
+        "slot": None,
+        "sql": "SELECT i.code, i.name, s.store_id, s.quantity, COALESCE(s.min_quantity, i.stock_min) AS min_quantity "
+               "FROM items i JOIN stocks s ON s.item_id = i.id "
+               "WHERE i.is_active = 1 AND s.quantity < COALESCE(s.min_quantity, i.stock_min) "
+               "ORDER BY s.quantity - COALESCE(s.min_quantity, i.stock_min), i.code LIMIT :limit;",
+    },
+    "item_stock": {
+        "patterns": [r"\bstock", r"\bquantite", r"\bcombien", r"\bdisponible", r"\bhow many\b"],
+        "vocabulary": STOCK_WORDS + LIST_WORDS + [
+            "quantite", "combien", "disponible", "reste", "restant", "niveau", "etat", "how", "many", "left",
+        ],
+        "exclude": STOCK_EXCLUDE,
+        "slot": "item",
+        "sql": "SELECT i.code, i.name, SUM(s.quantity) AS quantity FROM items i "
+               "JOIN stocks s ON s.item_id = i.id "
+               "WHERE i.id = :item_id GROUP BY i.id, i.code, i.name LIMIT :limit;",
+    },
+    "customer_balance": {
+        "patterns": [r"\bsolde", r"\bbalance\b", r"\bencours\b", r"\bdette", r"\bdoit\b", r"\bcombien .*\bdoit\b"],
+        "vocabulary": LIST_WORDS + [
+            "solde", "balance", "encours", "dette", "doit", "combien", "client", "customer", "compte", "actuel",
+            "plafond", "owe", "nous",
+        ],
+        "exclude": ["fournisseur", "supplier", "factur", "invoice", "histori", "evolution", "moyen", "average"],
+        "slot": "customer",
+        "sql": "SELECT c.code, c.name, c.solde, c.plafond FROM customers c WHERE c.id = :customer_id LIMIT :limit;",
+    },
+}
+
+lookup_queries = {
+    "item": "SELECT i.id, i.code, i.name FROM items i WHERE i.is_active = 1",
+    "brand": "SELECT b.id, NULL, b.name FROM brands b",
+    "customer": "SELECT c.id, c.code, c.name FROM customers c",
+}
@@ -1,10 +1,18 @@
+import json
 from langchain_core.prompts import ChatPromptTemplate
 
+def serialize_prompt_value(value) -> str:
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return str(value)
+
 def init_prompt(messages: list[tuple[str, str]], **kwargs) -> ChatPromptTemplate:
     prompt_template = ChatPromptTemplate.from_messages(messages)
     
     if kwargs:
-        return prompt_template.partial(**kwargs)
+        return prompt_template.partial(
+            **{key: serialize_prompt_value(value) for key, value in kwargs.items()}
+        )
     else:
         return prompt_template
 
@@ -30,6 +38,7 @@ STRICT RULES:
     - "out of stock" → `stocks.quantity <= 0`.
     - "maximum stock" → compare with `items.stock_max` or `stocks.max_quantity`.
 12. Unless the user specifies a specific number of examples they wish to obtain, always limit your query to at most 5 results.
+13. Prefer filtering and joining on the `indexed` columns of a table, especially on tables with many rows; `a -> t.c` marks a foreign key to `t.c`.
 
 ### Input:
 Database schema: {table_info}
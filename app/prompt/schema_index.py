@@ -0,0 +1,198 @@
+import re
+import math
+import unicodedata
+from collections import defaultdict, deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+FK_VALUE_PATTERN = re.compile(r"^(\w+)\.(\w+)$")
+
+JOIN_HINTS: Dict[str, str] = {
+    "article_code": "items",
+    "customer_id": "customers",
+    "client_id": "customers",
+    "supplier_id": "suppliers",
+    "fournisseur_id": "suppliers",
+}
+
+# relations whose key columns are not described in table_info
+TABLE_LINKS: List[Tuple[str, str]] = [
+    ("invoices", "customers"),
+    ("delivery_notes", "customers"),
+    ("sales_returns", "customers"),
+    ("items", "suppliers"),
+]
+
+TABLE_KEYWORDS: Dict[str, List[str]] = {
+    "items": ["article", "produit", "piece", "reference", "product", "part", "prix", "acheter", "buy"],
+    "stocks": ["stock", "rupture", "inventaire", "quantite", "disponible", "acheter", "commander", "buy"],
+    "stock_movements": ["mouvement", "entree", "sortie", "historique", "achat", "vente", "movement"],
+    "delivery_notes": ["livraison", "bon", "livre", "expedie", "delivery"],
+    "delivery_note_lines": ["livraison", "livre", "delivered"],
+    "invoices": ["facture", "paye", "impaye", "invoice", "paid"],
+    "invoice_lines": ["facture", "invoice"],
+    "sales_returns": ["retour", "avoir", "return"],
+    "sales_return_lines": ["retour", "returned"],
+    "brands": ["marque", "brand"],
+    "item_categories": ["categorie", "famille", "category"],
+    "item_equivalents": ["equivalent", "remplacement", "substitut"],
+    "suppliers": ["fournisseur", "supplier"],
+    "vehicles": ["vehicule", "voiture", "immatriculation", "plaque", "moteur", "modele", "vehicle"],
+    "customers": ["client", "customer", "solde", "plafond"],
+}
+
+STOPWORDS = {
+    "the", "a", "an", "of", "in", "on", "for", "to", "and", "or", "is", "are", "what", "which",
+    "how", "many", "much", "me", "show", "give", "list", "all", "with", "by", "id", "my",
+    "le", "la", "les", "de", "des", "du", "un", "une", "et", "ou", "est", "sont", "quel",
+    "quelle", "quels", "quelles", "combien", "moi", "pour", "par", "avec", "en", "dans", "sur",
+    "au", "aux", "qui", "que", "ce", "ces", "mon", "ma", "mes", "il", "y", "a",
+}
+
+
+def tokenize(value: str) -> List[str]:
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(c for c in value if not unicodedata.combining(c)).lower()
+    tokens = []
+    for word in re.split(r"[^a-z0-9]+", value):
+        if not word or word in STOPWORDS:
+            continue
+        if len(word) > 3 and word[-1] in "sx":
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def render_table(name: str, info: Dict[str, Any]) -> str:
+    foreign_keys = info.get("foreign_keys", {})
+    columns = ", ".join(
+        f"{column}: {label} -> {foreign_keys[column]}" if column in foreign_keys else f"{column}: {label}"
+        for column, label in info.get("columns", {}).items()
+    )
+    description = info.get("description", "")
+    if info.get("rows") is not None:
+        description = f"{description}, ~{info['rows']} rows" if description else f"~{info['rows']} rows"
+    rendered = f"{name} ({description}) | {columns}"
+    if info.get("indexed"):
+        rendered += f" | indexed: {', '.join(info['indexed'])}"
+    return rendered
+
+
+class SchemaIndex:
+    def __init__(self, table_info: Dict[str, Dict[str, Any]], top_k: int = 4,
+                 min_ratio: float = 0.25, keywords: Optional[Dict[str, List[str]]] = None):
+        self._table_info = table_info
+        self._top_k = top_k
+        self._min_ratio = min_ratio
+        self._keywords = TABLE_KEYWORDS if keywords is None else keywords
+        self._rendered = {name: render_table(name, info) for name, info in table_info.items()}
+        self._full_schema = "\n".join(self._rendered.values())
+        self._graph = self._build_graph()
+        self._weights = self._build_weights()
+
+    def _build_graph(self) -> Dict[str, Set[str]]:
+        graph: Dict[str, Set[str]] = defaultdict(set)
+        tables = set(self._table_info)
+        for name, info in self._table_info.items():
+            foreign_keys = info.get("foreign_keys", {})
+            for column, label in info.get("columns", {}).items():
+                target = None
+                match = FK_VALUE_PATTERN.match(str(foreign_keys.get(column, label)).strip())
+                if match and match.group(1) in tables:
+                    target = match.group(1)
+                elif column in JOIN_HINTS:
+                    target = JOIN_HINTS[column]
+                elif column.endswith("_id") and column[:-3] + "s" in tables:
+                    target = column[:-3] + "s"
+                if target and target != name:
+                    graph[name].add(target)
+                    graph[target].add(name)
+            if name.endswith("_lines") and name[:-6] + "s" in tables:
+                graph[name].add(name[:-6] + "s")
+                graph[name[:-6] + "s"].add(name)
+        for source, target in TABLE_LINKS:
+            if source in tables and target in tables:
+                graph[source].add(target)
+                graph[target].add(source)
+        return graph
+
+    def _build_weights(self) -> Dict[str, Dict[str, float]]:
+        raw: Dict[str, Dict[str, float]] = {}
+        for name, info in self._table_info.items():
+            weights: Dict[str, float] = defaultdict(float)
+            for token in tokenize(name.replace("_", " ")):
+                weights[token] += 3.0
+            for token in self._keywords.get(name, []):
+                for part in tokenize(token):
+                    weights[part] += 3.0
+            for token in tokenize(info.get("description", "")):
+                weights[token] += 1.0
+            for column, label in info.get("columns", {}).items():
+                for token in tokenize(column.replace("_", " ")):
+                    weights[token] += 0.5
+                for token in tokenize(str(label)):
+                    weights[token] += 0.5
+            raw[name] = weights
+
+        document_count = defaultdict(int)
+        for weights in raw.values():
+            for token in weights:
+                document_count[token] += 1
+        total = len(raw)
+        return {
+            name: {
+                token: weight * math.log(1 + total / document_count[token])
+                for token, weight in weights.items()
+            }
+            for name, weights in raw.items()
+        }
+
+    def get_full_schema(self) -> str:
+        return self._full_schema
+
+    def score(self, question: str, context: Iterable[str] = ()) -> Dict[str, float]:
+        query: Dict[str, float] = defaultdict(float)
+        for token in tokenize(question):
+            query[token] += 1.0
+        for previous in context:
+            for token in tokenize(previous):
+                query[token] += 0.5
+        scores = {}
+        for name, weights in self._weights.items():
+            value = sum(weight * weights.get(token, 0.0) for token, weight in query.items())
+            if value > 0:
+                scores[name] = value
+        return scores
+
+    def _join_path(self, source: str, target: str) -> List[str]:
+        parents = {source: None}
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            if current == target:
+                path = []
+                while current is not None:
+                    path.append(current)
+                    current = parents[current]
+                return path
+            for neighbour in self._graph.get(current, ()):
+                if neighbour not in parents:
+                    parents[neighbour] = current
+                    queue.append(neighbour)
+        return []
+
+    def select_tables(self, question: str, context: Iterable[str] = ()) -> List[str]:
+        scores = self.score(question, context)
+        if not scores:
+            return list(self._table_info)
+        ranked = sorted(scores, key=lambda name: scores[name], reverse=True)[:self._top_k]
+        threshold = scores[ranked[0]] * self._min_ratio
+        ranked = [name for name in ranked if scores[name] >= threshold]
+        selected = [ranked[0]]
+        for name in ranked[1:]:
+            for table in self._join_path(name, selected[0]) or [name]:
+                if table not in selected:
+                    selected.append(table)
+        return [name for name in self._table_info if name in selected]
+
+    def render(self, question: str, context: Iterable[str] = ()) -> str:
+        return "\n".join(self._rendered[name] for name in self.select_tables(question, context))
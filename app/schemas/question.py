@@ -1,5 +1,19 @@
-from pydantic import BaseModel
+import os
+from typing import List, Optional
+from pydantic import BaseModel, field_validator
 
 class Question(BaseModel):
     question: str
-    session_id: int
\ No newline at end of file
+    session_id: int
+
+class BatchQuestions(BaseModel):
+    questions: List[Question]
+    concurrency: Optional[int] = None
+
+    @field_validator("questions")
+    @classmethod
+    def check_size(cls, questions: List[Question]) -> List[Question]:
+        max_items = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+        if len(questions) > max_items:
+            raise ValueError(f"at most {max_items} questions per batch")
+        return questions
@@ -0,0 +1,229 @@
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from sqlalchemy import exc
+from app.db.database import QueryTimeoutError
+from app.services.hedging import LLMDeadlineExceeded
+
+INTERACTIVE = 0
+BATCH = 1
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"{reason}, retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_llm_overloaded(error: Exception) -> bool:
+    return is_rate_limited(error) or isinstance(error, LLMDeadlineExceeded)
+
+
+def is_db_overloaded(error: Exception) -> bool:
+    return isinstance(error, (QueryTimeoutError, exc.TimeoutError))
+
+
+class AdaptiveLimiter:
+    def __init__(self, name: str, limit: int, min_limit: int = 1, max_limit: int = 64,
+                 max_waiting: int = 64, max_wait_seconds: float = 10.0, tolerance: Optional[float] = 3.0,
+                 backoff: float = 0.7, is_overload: Callable[[Exception], bool] = lambda error: False):
+        self.name = name
+        self.limit = float(limit)
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._max_waiting = max_waiting
+        self._max_wait = max_wait_seconds
+        self._tolerance = tolerance
+        self._backoff = backoff
+        self._is_overload = is_overload
+        self._in_flight = 0
+        self._waiters: List[List[Any]] = []
+        self._sequence = itertools.count()
+        self._latency: Optional[float] = None
+        self._best_latency: Optional[float] = None
+        self._samples = 0
+        self._next_decrease = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.overloads = 0
+
+    def _fits(self, weight: int) -> bool:
+        return self._in_flight == 0 or self._in_flight + weight <= int(self.limit)
+
+    def retry_after(self) -> int:
+        latency = self._latency or 1.0
+        return max(1, math.ceil(latency * (len(self._waiters) + 1) / max(self.limit, 1.0)))
+
+    def check(self) -> None:
+        if len(self._waiters) >= self._max_waiting:
+            self.rejected += 1
+            raise Overloaded(f"{self.name} queue full", self.retry_after())
+
+    def _remove(self, waiter: List[Any]) -> None:
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+
+    def _wake(self) -> None:
+        while self._waiters and self._fits(self._waiters[0][2]):
+            _, _, weight, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._in_flight += weight
+            future.set_result(None)
+
+    def try_acquire(self, weight: int = 1) -> bool:
+        if self._waiters or not self._fits(weight):
+            return False
+        self._in_flight += weight
+        self.admitted += 1
+        return True
+
+    async def acquire(self, priority: int = INTERACTIVE, weight: int = 1) -> None:
+        if not self._waiters and self._fits(weight):
+            self._in_flight += weight
+            self.admitted += 1
+            return
+        self.check()
+        future = asyncio.get_running_loop().create_future()
+        waiter = [priority, next(self._sequence), weight, future]
+        heapq.heappush(self._waiters, waiter)
+        try:
+            await asyncio.wait_for(future, self._max_wait)
+        except asyncio.TimeoutError:
+            self._remove(waiter)
+            self.timeouts += 1
+            raise Overloaded(f"{self.name} wait exceeded {self._max_wait}s", self.retry_after())
+        except asyncio.CancelledError:
+            self._remove(waiter)
+            if future.done() and not future.cancelled():
+                self.release(weight)
+            raise
+        self.admitted += 1
+
+    def release(self, weight: int = 1) -> None:
+        self._in_flight -= weight
+        self._wake()
+
+    def record_latency(self, seconds: float) -> None:
+        self._samples += 1
+        self._latency = seconds if self._latency is None else 0.8 * self._latency + 0.2 * seconds
+        if self._best_latency is None or self._latency < self._best_latency or self._samples % 500 == 0:
+            self._best_latency = self._latency
+        if self._tolerance is not None and self._latency > self._tolerance * self._best_latency:
+            self.decrease()
+        else:
+            self.limit = min(float(self._max_limit), self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def decrease(self) -> None:
+        if self._samples < self._next_decrease:
+            return
+        self.limit = max(float(self._min_limit), self.limit * self._backoff)
+        self._next_decrease = self._samples + int(self.limit)
+
+    def record_overload(self) -> None:
+        self.overloads += 1
+        self._samples += 1
+        self.decrease()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE, weight: int = 1) -> AsyncIterator[None]:
+        await self.acquire(priority, weight)
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            if self._is_overload(e):
+                self.record_overload()
+            raise
+        else:
+            self.record_latency(time.perf_counter() - started)
+        finally:
+            self.release(weight)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "waiting": len(self._waiters),
+            "latency_seconds": self._latency or 0.0,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "overloads": self.overloads,
+        }
+
+
+class SessionLocks:
+    def __init__(self, max_pending: int = 4):
+        self._max_pending = max_pending
+        self._locks: Dict[int, List[Any]] = {}
+        self.rejected = 0
+
+    async def acquire(self, session_id: int, bounded: bool = True) -> None:
+        entry = self._locks.get(session_id)
+        if entry is None:
+            entry = self._locks[session_id] = [asyncio.Lock(), 0]
+        elif bounded and entry[1] > self._max_pending:
+            self.rejected += 1
+            raise Overloaded(f"too many pending requests for session {session_id}", 1)
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._forget(session_id, entry)
+            raise
+
+    def release(self, session_id: int) -> None:
+        entry = self._locks[session_id]
+        entry[0].release()
+        self._forget(session_id, entry)
+
+    def _forget(self, session_id: int, entry: List[Any]) -> None:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[session_id]
+
+    @asynccontextmanager
+    async def hold(self, session_id: int) -> AsyncIterator[None]:
+        await self.acquire(session_id)
+        try:
+            yield
+        finally:
+            self.release(session_id)
+
+    def stats(self) -> Dict[str, float]:
+        return {"sessions": len(self._locks), "rejected": self.rejected}
+
+
+class AdmissionControl:
+    def __init__(self, llm: AdaptiveLimiter, db: AdaptiveLimiter, sessions: SessionLocks):
+        self.llm = llm
+        self.db = db
+        self.sessions = sessions
+
+    def check(self) -> None:
+        self.llm.check()
+        self.db.check()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {"llm": self.llm.stats(), "db": self.db.stats(), "sessions": self.sessions.stats()}
+
+
+def llm_slot(state: Any, weight: int = 1):
+    return state.admission.llm.slot(getattr(state, "priority", INTERACTIVE), weight)
+
+
+def db_slot(state: Any, weight: int = 1):
+    return state.admission.db.slot(getattr(state, "priority", INTERACTIVE), weight)
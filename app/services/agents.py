@@ -0,0 +1,43 @@
+import asyncio
+import logging
+import itertools
+from typing import Any
+from app.services.chat import IAModel
+from app.services.admission import INTERACTIVE
+
+_versions = itertools.count(1)
+
+
+class AgentSet:
+    __slots__ = ("version", "sql_agent", "nlp_agent")
+
+    def __init__(self, sql_agent: IAModel, nlp_agent: IAModel):
+        self.version = next(_versions)
+        self.sql_agent = sql_agent
+        self.nlp_agent = nlp_agent
+
+    async def warm_up(self) -> None:
+        await asyncio.gather(self.sql_agent.warm_up(), self.nlp_agent.warm_up())
+
+
+class PinnedState:
+    def __init__(self, state: Any, agents: AgentSet, priority: int = INTERACTIVE):
+        self._state = state
+        self.priority = priority
+        self.agents = agents
+        self.sql_agent = agents.sql_agent
+        self.nlp_agent = agents.nlp_agent
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._state, name)
+
+
+def install_agents(state: Any, agents: AgentSet) -> None:
+    state.agents = agents
+    state.sql_agent = agents.sql_agent
+    state.nlp_agent = agents.nlp_agent
+    logging.info("LLM agents version %s installed.", agents.version)
+
+
+def pin_agents(state: Any, priority: int = INTERACTIVE) -> PinnedState:
+    return PinnedState(state, state.agents, priority)
@@ -0,0 +1,166 @@
+import re
+from collections import Counter
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from app.db.database import ResultSet
+from app.services.result_encoder import format_value, is_numeric
+
+NO_MATCH_RESULT = {"result": "no matching item"}
+
+COUNT_PATTERN = re.compile(r"^(count\(.*\)|nb\w*|nombre\w*|count\w*|total_count)$", re.IGNORECASE)
+VOWELS = "aeiouyéèêh"
+
+KIND_HINTS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("flag", ("(1/0)", "(1=yes")),
+    ("percent", ("%", "vat rate", "discount")),
+    ("date", ("date",)),
+    ("quantity", ("qty", "quantity", "threshold", "min stock", "max stock")),
+    ("money", ("price", "cost", "total", "balance", "credit limit")),
+]
+
+NAME_KINDS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("quantity", ("quantit", "qty", "stock")),
+    ("money", ("total", "montant", "price", "prix", "solde", "plafond")),
+]
+
+
+def column_kinds(table_info: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+    kinds: Dict[str, str] = {}
+    for info in table_info.values():
+        for column, description in info.get("columns", {}).items():
+            if column in kinds:
+                continue
+            description = str(description).lower()
+            if column == "id" or column.endswith("_id"):
+                kinds[column] = "id"
+                continue
+            kinds[column] = next(
+                (kind for kind, hints in KIND_HINTS if any(hint in description for hint in hints)), "text"
+            )
+    return kinds
+
+
+def fr_number(value: Any, decimals: int) -> str:
+    text = f"{float(value):,.{decimals}f}" if decimals else f"{int(round(float(value))):,}"
+    return text.replace(",", " ").replace(".", ",")
+
+
+def with_article(label: str, gender: str) -> str:
+    if label[0].lower() in VOWELS:
+        return f"l'{label}"
+    return f"{'la' if gender == 'f' else 'le'} {label}"
+
+
+class AnswerFormatter:
+    def __init__(self, table_info: Dict[str, Dict[str, Any]], labels: Dict[str, Tuple[str, str]],
+                 subjects: Dict[str, Sequence[str]], max_rows: int = 10, max_columns: int = 6):
+        self._kinds = column_kinds(table_info)
+        self._labels = labels
+        self._name_columns = tuple(subjects.get("name", ()))
+        self._code_columns = tuple(subjects.get("code", ()))
+        self._max_rows = max_rows
+        self._max_columns = max_columns
+        self.shapes: Counter = Counter()
+
+    def kind_of(self, column: str) -> Optional[str]:
+        if column in self._kinds:
+            return self._kinds[column]
+        lowered = column.lower()
+        return next((kind for kind, hints in NAME_KINDS if any(hint in lowered for hint in hints)), None)
+
+    def render_value(self, column: str, value: Any) -> str:
+        kind = self.kind_of(column)
+        if value is None:
+            return "non renseigné"
+        if kind == "flag":
+            return "oui" if value in (1, True, "1") else "non"
+        if kind == "quantity" and is_numeric(value):
+            integral = float(value).is_integer()
+            return f"{fr_number(value, 0 if integral else 2)} unité{'s' if abs(float(value)) >= 2 else ''}"
+        if kind == "money" and is_numeric(value):
+            return fr_number(value, 2)
+        if kind == "percent" and is_numeric(value):
+            return f"{fr_number(value, 0 if float(value).is_integer() else 2)} %"
+        if kind == "date" and isinstance(value, (date, datetime)):
+            return value.strftime("%d/%m/%Y")
+        if is_numeric(value) and not isinstance(value, int):
+            return fr_number(value, 2) if not float(value).is_integer() else fr_number(value, 0)
+        return format_value(value)
+
+    def subject(self, columns: Sequence[str], row: Sequence[Any]) -> Tuple[str, List[int]]:
+        name = next((index for index, column in enumerate(columns) if column in self._name_columns), None)
+        code = next((index for index, column in enumerate(columns) if column in self._code_columns), None)
+        used = [index for index in (name, code) if index is not None]
+        if name is not None and code is not None:
+            return f"{format_value(row[name])} ({format_value(row[code])})", used
+        if used:
+            return format_value(row[used[0]]), used
+        return "", used
+
+    def fields(self, columns: Sequence[str], row: Sequence[Any], skip: List[int]) -> List[str]:
+        return [
+            f"{self._labels[column][0]} {self.render_value(column, value)}"
+            for index, (column, value) in enumerate(zip(columns, row)) if index not in skip
+        ]
+
+    def is_supported(self, columns: Sequence[str]) -> bool:
+        return bool(columns) and len(columns) <= self._max_columns and all(
+            column in self._labels and self.kind_of(column) is not None for column in columns
+        )
+
+    def format_scalar(self, column: str, value: Any) -> Optional[str]:
+        if COUNT_PATTERN.match(column) and is_numeric(value):
+            count = int(value)
+            if count == 0:
+                return "Aucun élément ne correspond à votre demande."
+            return f"Il y a {fr_number(count, 0)} élément{'s' if count > 1 else ''} correspondant à votre demande."
+        if not self.is_supported([column]):
+            return None
+        label, gender = self._labels[column]
+        return f"{with_article(label, gender).capitalize()} est de {self.render_value(column, value)}."
+
+    def format_row(self, columns: Sequence[str], row: Sequence[Any]) -> Optional[str]:
+        subject, used = self.subject(columns, row)
+        remaining = [index for index in range(len(columns)) if index not in used]
+        if len(remaining) == 1 and subject:
+            column = columns[remaining[0]]
+            label, gender = self._labels[column]
+            return f"{subject} : {with_article(label, gender)} est de {self.render_value(column, row[remaining[0]])}."
+        fields = self.fields(columns, row, used)
+        if not fields:
+            return f"{subject}." if subject else None
+        return f"{subject} : {', '.join(fields)}." if subject else f"{', '.join(fields).capitalize()}."
+
+    def format_list(self, result: ResultSet) -> str:
+        count = len(result.rows)
+        lines = ["Voici les {} {}résultats :".format(count, "premiers " if result.truncated else "")]
+        for row in result.rows:
+            subject, used = self.subject(result.columns, row)
+            fields = ", ".join(self.fields(result.columns, row, used))
+            lines.append(f"- {subject} : {fields}" if subject and fields else f"- {subject or fields}")
+        return "\n".join(lines)
+
+    def format(self, data: Any) -> Optional[str]:
+        shape, answer = self.classify(data)
+        self.shapes[shape if answer is not None else "fallback"] += 1
+        return answer
+
+    def classify(self, data: Any) -> Tuple[str, Optional[str]]:
+        if data == NO_MATCH_RESULT:
+            return "empty", "Aucun élément ne correspond à votre demande."
+        if not isinstance(data, list) or len(data) != 1 or not isinstance(data[0], ResultSet):
+            return "other", None
+        result = data[0]
+        columns, rows = result.columns, result.rows
+        if len(rows) == 1 and len(columns) == 1:
+            return "scalar", self.format_scalar(columns[0], rows[0][0])
+        if not self.is_supported(columns):
+            return "other", None
+        if len(rows) == 1:
+            return "row", self.format_row(columns, rows[0])
+        if len(rows) <= self._max_rows:
+            return "list", self.format_list(result)
+        return "other", None
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.shapes)
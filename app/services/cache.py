@@ -0,0 +1,105 @@
+import re
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+
+def schema_fingerprint(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def normalize_question(question: str) -> str:
+    question = unicodedata.normalize("NFKD", question)
+    question = "".join(c for c in question if not unicodedata.combining(c))
+    question = re.sub(r"\s+", " ", question.lower()).strip()
+    return question.rstrip(" ?!.;")
+
+
+class TTLCache:
+    def __init__(self, max_size: int = 1024, ttl_seconds: Optional[float] = None):
+        self._max_size = max_size
+        self._ttl = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[Optional[float], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = ttl_seconds if ttl_seconds is not None else self._ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        with self._lock:
+            stale = [key for key, (_, value) in self._entries.items() if predicate(key, value)]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "max_size": self._max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SQLQueryCache(TTLCache):
+    def __init__(self, fingerprint: str, max_size: int = 512, ttl_seconds: Optional[float] = None):
+        super().__init__(max_size=max_size, ttl_seconds=ttl_seconds)
+        self._fingerprint = fingerprint
+
+    def get_fingerprint(self) -> str:
+        return self._fingerprint
+
+    def set_fingerprint(self, fingerprint: str) -> bool:
+        if fingerprint == self._fingerprint:
+            return False
+        self._fingerprint = fingerprint
+        self.clear()
+        return True
+
+    def make_key(self, question: str, history: Iterable[Any]) -> str:
+        parts = [self._fingerprint, normalize_question(question)]
+        for message in history:
+            parts.append(f"{message.type}:{message.content}")
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
@@ -1,92 +1,402 @@
-from langchain_core.prompts import BasePromptTemplate
-from typing import Optional, Dict, Any
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from langchain_core.prompts import BasePromptTemplate, MessagesPlaceholder
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableLambda
+from typing import Optional, Dict, Any, AsyncIterator, Callable, List, Tuple
 from langchain_core.language_models import BaseLanguageModel
-from langchain_core.chat_history import InMemoryChatMessageHistory
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from app.services.memory_backend import MemoryBackend, InProcessBackend
+from app.services.result_encoder import estimate_tokens
+from app.services.hedging import Attempt, HedgePolicy, LatencyWindow, LLMDeadlineExceeded, hedged_call
+
+HUMAN = "human"
+AI = "ai"
+HISTORY_KEY = "history"
+WARM_UP_PROMPT = "ping"
+
+Compactor = Callable[[str, str], str]
+
+def to_message(role: str, content: str) -> BaseMessage:
+    return HumanMessage(content=content) if role == HUMAN else AIMessage(content=content)
+
+class SessionRecord:
+    __slots__ = ("window", "questions", "size", "tokens")
+
+    def __init__(self, capacity: int):
+        self.window: deque = deque(maxlen=capacity)
+        self.questions = 0
+        self.size = 0
+        self.tokens = 0
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return [to_message(entry[0], entry[1]) for entry in self.window]
+
+    def pairs(self) -> List[Tuple[str, str]]:
+        return [(entry[0], entry[1]) for entry in self.window]
+
+    def append(self, role: str, content: str, compacted: bool = False) -> int:
+        freed, freed_tokens = 0, 0
+        if len(self.window) == self.window.maxlen:
+            freed, freed_tokens = self.window[0][2], self.window[0][3]
+        size = len(content.encode("utf-8"))
+        tokens = estimate_tokens(content)
+        self.window.append((role, content, size, tokens, compacted))
+        self.size += size - freed
+        self.tokens += tokens - freed_tokens
+        return size - freed
+
+    def replace(self, index: int, content: str, compacted: bool = True) -> int:
+        role, _, old_size, old_tokens, _ = self.window[index]
+        size = len(content.encode("utf-8"))
+        tokens = estimate_tokens(content)
+        self.window[index] = (role, content, size, tokens, compacted)
+        self.size += size - old_size
+        self.tokens += tokens - old_tokens
+        return size - old_size
+
+    def popleft(self) -> int:
+        _, _, size, tokens, _ = self.window.popleft()
+        self.size -= size
+        self.tokens -= tokens
+        return size
+
+    def pop(self) -> int:
+        _, _, size, tokens, _ = self.window.pop()
+        self.size -= size
+        self.tokens -= tokens
+        return size
 
 class ChatMemory:
-    def __init__(self):
-        self._conversation: Dict[int, InMemoryChatMessageHistory] = {}
-        self._counter_question: Dict[int, int] = {}
-        
-    def get_session_by_id(self, session_id: int) -> InMemoryChatMessageHistory:
-        if session_id not in self._conversation:
-            self._conversation[session_id] = InMemoryChatMessageHistory()
-            self._counter_question[session_id] = 0
-        return self._conversation[session_id]
+    def __init__(self, max_sessions: int = 10000, max_bytes: int = 64 * 1024 * 1024,
+                 window_messages: int = 8, backend: Optional[MemoryBackend] = None,
+                 namespace: str = "default", token_budget: Optional[int] = None,
+                 max_questions: Optional[int] = 3, compactor: Optional[Compactor] = None,
+                 keep_full_turns: int = 1):
+        self._sessions: "OrderedDict[int, SessionRecord]" = OrderedDict()
+        self._backend = backend if backend is not None else InProcessBackend()
+        self._namespace = namespace
+        self._max_sessions = max_sessions
+        self._max_bytes = max_bytes
+        self._window_messages = window_messages
+        self._token_budget = token_budget
+        self._max_questions = max_questions
+        self._compactor = compactor
+        self._keep_full_turns = keep_full_turns
+        self._bytes = 0
+        self._evictions = 0
+        self._lock = threading.RLock()
+
+    def _evict(self, keep: int) -> None:
+        while self._sessions and (len(self._sessions) > self._max_sessions or self._bytes > self._max_bytes):
+            oldest = next(iter(self._sessions))
+            if oldest == keep:
+                if len(self._sessions) == 1:
+                    return
+                self._sessions.move_to_end(oldest)
+                continue
+            self._bytes -= self._sessions.pop(oldest).size
+            self._evictions += 1
+
+    def get_session_by_id(self, session_id: int) -> SessionRecord:
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is None:
+                record = SessionRecord(self._window_messages)
+                self._sessions[session_id] = record
+                self._evict(keep=session_id)
+            else:
+                self._sessions.move_to_end(session_id)
+            return record
+
+    def get_messages(self, session_id: int) -> List[BaseMessage]:
+        return self.get_session_by_id(session_id).messages
+
+    def _drop_local(self, session_id: int):
+        with self._lock:
+            record = self._sessions.pop(session_id, None)
+            if record is not None:
+                self._bytes -= record.size
 
     def clear_history_by_id(self, session_id: int):
-        if session_id in self._conversation:
-            self._conversation[session_id] = InMemoryChatMessageHistory()
-        if session_id in self._counter_question:
-            self._counter_question[session_id] = 0
+        self._drop_local(session_id)
+        self._backend.delete(self._namespace, session_id)
+
+    def expire_session(self, session_id: int, idle_before: float):
+        self._drop_local(session_id)
+        self._backend.delete_if_idle(self._namespace, session_id, idle_before)
+
+    def is_shared(self) -> bool:
+        return self._backend.shared
+
+    def load_session(self, session_id: int):
+        if not self._backend.shared:
+            return
+        messages = self._backend.load(self._namespace, session_id)
+        with self._lock:
+            self._drop_local(session_id)
+            record = self.get_session_by_id(session_id)
+            for role, content in messages or ():
+                if role == HUMAN:
+                    record.questions += 1
+                self._bytes += record.append(role, content)
+            self._evict(keep=session_id)
+
+    def flush(self, session_id: int):
+        if not self._backend.shared:
+            return
+        with self._lock:
+            record = self._sessions.get(session_id)
+            messages = record.pairs() if record else None
+        if messages:
+            self._backend.save(self._namespace, session_id, messages)
         
     def clear_all_sessions(self):
-        for session_id in self._conversation:
-            self._conversation[session_id].clear()
-        self._conversation = {}
+        with self._lock:
+            self._sessions.clear()
+            self._bytes = 0
     
     def get_session_callable(self, session_id: int):
-        def get_history(session_id: str) -> InMemoryChatMessageHistory:
+        def get_history(session_id: str) -> SessionRecord:
             return self.get_session_by_id(session_id)
         return get_history
+
+    def _add_message(self, session_id: int, role: str, content: Any):
+        with self._lock:
+            record = self.get_session_by_id(session_id)
+            if role == HUMAN:
+                record.questions += 1
+            self._bytes += record.append(role, content if isinstance(content, str) else str(content))
+            self._evict(keep=session_id)
     
     def add_user_message(self, session_id: int, user_message):
-        history = self.get_session_by_id(session_id)
-        self._counter_question[session_id] += 1
-        history.add_user_message(user_message)
+        self._add_message(session_id, HUMAN, user_message)
 
     def add_ai_message(self, session_id: int, ai_message):
-        history = self.get_session_by_id(session_id)
-        history.add_ai_message(ai_message)
+        self._add_message(session_id, AI, ai_message)
+
+    def fold_last_turn(self, session_id: int):
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is None or len(record.window) < 4 or record.window[-1][0] != AI or record.window[-3][0] != AI:
+                return
+            answer = record.window[-1][1]
+            self._bytes -= record.pop()
+            self._bytes -= record.pop()
+            record.questions -= 1
+            self._bytes += record.replace(len(record.window) - 1, answer, compacted=False)
+
+    def drop_last_question(self, session_id: int):
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is not None and record.window and record.window[-1][0] == HUMAN:
+                self._bytes -= record.pop()
+                record.questions -= 1
+
+    def drop_last_answer(self, session_id: int):
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is not None and record.window and record.window[-1][0] == AI:
+                self._bytes -= record.pop()
 
     def reset_history(self, session_id: int, max_question: int):
-        if session_id not in self._counter_question:
-            return
-        counter = self._counter_question[session_id]
-        if counter >= max_question:
+        record = self._sessions.get(session_id)
+        if record is not None and record.questions >= max_question:
             self.clear_history_by_id(session_id)
     
-    def rotate_history(self, session_id: int, max_questions: int):
-        if session_id not in self._conversation:
-            return
-        history = self._conversation[session_id]
-        total_messages = len(history.messages)
-        max_messages = max_questions * 2
-        if total_messages > max_messages:
-            messages_to_keep = history.messages[-max_messages:]
-            history.messages = messages_to_keep
-            self._counter_question[session_id] = max_questions
+    def _compact(self, record: SessionRecord) -> None:
+        window = record.window
+        for index in range(len(window) - self._keep_full_turns * 2):
+            role, content, _, _, compacted = window[index]
+            if compacted:
+                continue
+            compact = self._compactor(role, content)
+            if compact != content:
+                self._bytes += record.replace(index, compact)
+
+    def _drop_turn(self, record: SessionRecord) -> None:
+        self._bytes -= record.popleft()
+        while record.window and record.window[0][0] != HUMAN:
+            self._bytes -= record.popleft()
+
+    def rotate_history(self, session_id: int, max_questions: Optional[int] = None):
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is None:
+                return
+            window = record.window
+            while window and window[0][0] != HUMAN:
+                self._bytes -= record.popleft()
+            max_questions = max_questions if max_questions is not None else self._max_questions
+            if max_questions is not None:
+                while len(window) > max_questions * 2:
+                    self._drop_turn(record)
+            if self._compactor is not None:
+                self._compact(record)
+            if self._token_budget is not None:
+                while record.tokens > self._token_budget and len(window) > 2:
+                    self._drop_turn(record)
+            record.questions = sum(1 for entry in window if entry[0] == HUMAN)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self._bytes,
+            "max_sessions": self._max_sessions,
+            "max_bytes": self._max_bytes,
+            "evictions": self._evictions,
+        }
+
+def model_name(model: Any) -> str:
+    return getattr(model, "model_name", None) or getattr(model, "model", None) or type(model).__name__
 
 class IAModel:
-    def __init__(self):
+    def __init__(self, name: str = "agent"):
+        self.name = name
         self._model: Optional[BaseLanguageModel] = None
+        self._cascade_model: Optional[BaseLanguageModel] = None
         self._prompt: Optional[BasePromptTemplate] = None
+        self._chain: Optional[Runnable] = None
+        self._cascade_chain: Optional[Runnable] = None
+        self._policy = HedgePolicy()
+        self._windows = (LatencyWindow(), LatencyWindow())
+        self._call_stats = {"calls": 0, "hedges": 0, "hedge_wins": 0, "hedge_skips": 0, "errors": 0, "escalations": 0}
         self._engine = None
+        self._async_engine = None
         self._memory = ChatMemory()
+        self._render_count = 0
+        self._render_seconds = 0.0
+        self._render_max_seconds = 0.0
+
+    def _compile(self):
+        if self._model is None or self._prompt is None:
+            self._chain = None
+            self._cascade_chain = None
+            return
+        render = RunnableLambda(self._render, afunc=self._arender)
+        self._chain = render | self._model
+        self._cascade_chain = render | self._cascade_model if self._cascade_model is not None else None
 
     def set_model(self, model: BaseLanguageModel):
         self._model = model
+        self._compile()
+
+    def set_cascade_model(self, model: Optional[BaseLanguageModel]):
+        self._cascade_model = model
+        self._compile()
+
+    def has_cascade(self) -> bool:
+        return self._cascade_model is not None
+
+    def set_call_policy(self, policy: HedgePolicy):
+        self._policy = policy
     
     def set_prompt(self, prompt: BasePromptTemplate):
+        if HISTORY_KEY not in prompt.input_variables + list(getattr(prompt, "optional_variables", [])):
+            prompt = prompt + MessagesPlaceholder(HISTORY_KEY, optional=True)
         self._prompt = prompt
+        self._compile()
 
     def set_engine(self, engine):
         self._engine = engine
     
     def get_engine(self):
         return self._engine
+
+    def set_async_engine(self, engine):
+        self._async_engine = engine
+
+    def get_async_engine(self):
+        return self._async_engine
     
+    def set_memory(self, memory: ChatMemory):
+        self._memory = memory
+
     def get_memory(self):
         return self._memory
+
+    def _render(self, variables: Dict[str, Any]) -> PromptValue:
+        start = time.perf_counter()
+        prompt_value = self._prompt.invoke(variables)
+        elapsed = time.perf_counter() - start
+        self._render_count += 1
+        self._render_seconds += elapsed
+        self._render_max_seconds = max(self._render_max_seconds, elapsed)
+        return prompt_value
+
+    async def _arender(self, variables: Dict[str, Any]) -> PromptValue:
+        return self._render(variables)
+
+    def get_render_stats(self) -> Dict[str, float]:
+        count = self._render_count
+        return {
+            "count": count,
+            "total_seconds": self._render_seconds,
+            "avg_seconds": self._render_seconds / count if count else 0.0,
+            "max_seconds": self._render_max_seconds,
+        }
+
+    def get_call_stats(self) -> Dict[str, float]:
+        stats: Dict[str, float] = dict(self._call_stats)
+        for tier, window in zip(("primary", "cascade"), self._windows):
+            p95 = window.quantile(0.95)
+            if p95 is not None:
+                stats[f"{tier}_p95_seconds"] = p95
+        return stats
+
+    async def warm_up(self) -> None:
+        for model in (self._model, self._cascade_model):
+            if model is not None:
+                await model.ainvoke(WARM_UP_PROMPT, max_tokens=1)
+
+    async def _ainvoke(self, variables: Dict[str, Any], escalate: bool = False, **invoke_kwargs) -> AIMessage:
+        escalate = escalate and self._cascade_chain is not None
+        chain = self._cascade_chain if escalate else self._get_chain()
+        tier = "cascade" if escalate else "primary"
+        name = model_name(self._cascade_model if escalate else self._model)
+
+        def describe(kind: str, seconds: float, outcome: str) -> Attempt:
+            return {"agent": self.name, "model": name, "tier": tier, "kind": kind,
+                    "seconds": round(seconds, 4), "outcome": outcome}
+
+        self._call_stats["calls"] += 1
+        self._call_stats["escalations"] += escalate
+        try:
+            result, attempts = await hedged_call(
+                lambda: chain.ainvoke(variables, **invoke_kwargs), self._policy, self._windows[escalate], describe
+            )
+        except Exception:
+            self._call_stats["errors"] += 1
+            raise
+        hedged = [attempt for attempt in attempts if attempt["kind"] == "hedge" and attempt["outcome"] != "skipped"]
+        self._call_stats["hedges"] += len(hedged)
+        self._call_stats["hedge_skips"] += any(attempt["outcome"] == "skipped" for attempt in attempts)
+        self._call_stats["hedge_wins"] += any(attempt["outcome"] == "ok" for attempt in hedged)
+        result.response_metadata["attempts"] = attempts
+        return result
+
+    def _get_chain(self) -> Runnable:
+        if self._chain is None:
+            raise RuntimeError("The template and prompt must be defined before generating a response.")
+        return self._chain
     
     def get_response(self, variables: Dict[str, Any]):
-        if not self._model or not self._prompt:
-            raise RuntimeError("The template and prompt must be defined before generating a response.")
-
-        chain = self._prompt | self._model
-        return chain.invoke(variables)
+        return self._get_chain().invoke(variables)
     
+    def _prepare_variables(self, session_id: int,
+                           user_question: Optional[str],
+                           add_to_history: bool,
+                           dynamic_variables: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if user_question is not None and add_to_history:
+            self._memory.add_user_message(session_id, user_question)
+
+        variables = dict(dynamic_variables or {})
+        variables[HISTORY_KEY] = self._memory.get_messages(session_id)
+        return variables
+
     def get_response_with_memory(self, session_id: int,
                                  user_question: Optional[str] = None,
                                  add_to_history: bool = True,
@@ -94,19 +404,96 @@ class IAModel:
                                  **invoke_kwargs
         ) -> AIMessage:
     
-        if user_question is not None and add_to_history:
-            self._memory.add_user_message(session_id, user_question)
+        chain = self._get_chain()
+        variables = self._prepare_variables(session_id, user_question, add_to_history, dynamic_variables)
+        result = chain.invoke(variables, **invoke_kwargs)
 
-        history = self._memory.get_session_by_id(session_id)
-        prompt_copy = self._prompt.model_copy()
-        print(f"History : {history}")
-        for message in history.messages:
-            prompt_copy.messages.append(message)
+        if add_to_history:
+            self._memory.add_ai_message(session_id, result.content)
 
-        chain = prompt_copy | self._model
-        result = chain.invoke(dynamic_variables or {}, **invoke_kwargs)
+        return result
+
+    async def aget_response_with_memory(self, session_id: int,
+                                        user_question: Optional[str] = None,
+                                        add_to_history: bool = True,
+                                        dynamic_variables: Optional[Dict[str, Any]] = None,
+                                        escalate: bool = False,
+                                        **invoke_kwargs
+        ) -> AIMessage:
+
+        self._get_chain()
+        variables = self._prepare_variables(session_id, user_question, add_to_history, dynamic_variables)
+        result = await self._ainvoke(variables, escalate, **invoke_kwargs)
 
         if add_to_history:
             self._memory.add_ai_message(session_id, result.content)
 
-        return result
\ No newline at end of file
+        return result
+
+    async def abatch_responses_with_memory(self, requests: List[Tuple[int, str, Optional[Dict[str, Any]]]],
+                                           max_concurrency: Optional[int] = None,
+                                           **invoke_kwargs
+        ) -> List[Any]:
+
+        self._get_chain()
+        variables = [
+            self._prepare_variables(session_id, user_question, True, dynamic_variables)
+            for session_id, user_question, dynamic_variables in requests
+        ]
+        semaphore = asyncio.Semaphore(max_concurrency or len(variables) or 1)
+
+        async def run(item_variables: Dict[str, Any]) -> AIMessage:
+            async with semaphore:
+                return await self._ainvoke(item_variables, **invoke_kwargs)
+
+        results = await asyncio.gather(*(run(item) for item in variables), return_exceptions=True)
+        for (session_id, _, _), result in zip(requests, results):
+            if not isinstance(result, Exception):
+                self._memory.add_ai_message(session_id, result.content)
+
+        return results
+
+    async def astream_response_with_memory(self, session_id: int,
+                                           user_question: Optional[str] = None,
+                                           add_to_history: bool = True,
+                                           dynamic_variables: Optional[Dict[str, Any]] = None,
+                                           **invoke_kwargs
+        ) -> AsyncIterator[str]:
+
+        chain = self._get_chain()
+        variables = self._prepare_variables(session_id, user_question, add_to_history, dynamic_variables)
+        chunks = []
+        completed = False
+        stream = chain.astream(variables, **invoke_kwargs)
+        started = time.perf_counter()
+        deadline = self._policy.deadline
+        try:
+            # only the wait for the first token is bounded, the rest streams at the model's pace
+            while not chunks:
+                remaining = started + deadline - time.perf_counter() if deadline else None
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), remaining)
+                except StopAsyncIteration:
+                    completed = True
+                    return
+                except asyncio.TimeoutError:
+                    self._call_stats["errors"] += 1
+                    raise LLMDeadlineExceeded(deadline, [{
+                        "agent": self.name, "model": model_name(self._model), "tier": "primary",
+                        "kind": "stream", "seconds": round(time.perf_counter() - started, 4), "outcome": "deadline",
+                    }]) from None
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield chunk.content
+            async for chunk in stream:
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield chunk.content
+            completed = True
+        finally:
+            await stream.aclose()
+            # a failed or abandoned stream leaves no half answer in the next turn's prompt
+            if add_to_history and completed:
+                self._memory.add_ai_message(session_id, "".join(chunks))
+            elif add_to_history and user_question is not None:
+                self._memory.drop_last_question(session_id)
@@ -1,35 +1,238 @@
 import os
+import httpx
+from functools import lru_cache
 from langchain_groq import ChatGroq
-from app.services.chat import IAModel
+from app.services.chat import IAModel, ChatMemory
+from app.services.hedging import HedgePolicy
+from app.services.cache import SQLQueryCache, schema_fingerprint
+from app.services.session_expiry import SessionExpiry
+from app.services.coalescer import SingleFlight
+from app.services.agents import AgentSet
+from app.services.history import get_compactor
+from app.services.intents import IntentRouter
+from app.services.answer_formatter import AnswerFormatter
+from app.services.admission import (
+    AdmissionControl,
+    AdaptiveLimiter,
+    SessionLocks,
+    is_llm_overloaded,
+    is_db_overloaded,
+)
+from app.services.memory_backend import MemoryBackend, InProcessBackend, SQLiteBackend
+from typing import Optional
 from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from app.db.cache import ResultCache
+from app.db.router import EngineRouter
+from app.db.database import CostGuard, create_pooled_engine
+from app.db.schema_snapshot import SchemaSnapshot, load_schema_snapshot, static_snapshot
 from app.prompt.prompt import sql_prompt, nlp_prompt, init_prompt
 from app.prompt.table_info import table_info
+from app.prompt.schema_index import SchemaIndex
+from app.prompt.intent_templates import intent_templates, lookup_queries
+from app.prompt.column_labels import column_labels, subject_columns
 
-def set_sql_agent(engine: Engine) -> IAModel:
-    sql_agent = IAModel()
+@lru_cache(maxsize=None)
+def get_memory_backend() -> MemoryBackend:
+    backend = os.getenv("CHAT_MEMORY_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteBackend(os.getenv("CHAT_MEMORY_SQLITE_PATH", "/tmp/az_chat_memory.sqlite3"))
+    if backend != "memory":
+        raise RuntimeError(f"Unknown CHAT_MEMORY_BACKEND: {backend}")
+    return InProcessBackend()
+
+def set_chat_memory(namespace: str) -> ChatMemory:
+    return ChatMemory(
+        max_sessions=int(os.getenv("CHAT_MEMORY_MAX_SESSIONS", "10000")),
+        max_bytes=int(os.getenv("CHAT_MEMORY_MAX_BYTES", str(64 * 1024 * 1024))),
+        window_messages=int(os.getenv("CHAT_MEMORY_WINDOW_MESSAGES", "8")),
+        backend=get_memory_backend(),
+        namespace=namespace,
+        token_budget=int(os.getenv(f"{namespace.upper()}_HISTORY_TOKEN_BUDGET", "600")) or None,
+        max_questions=int(os.getenv("HISTORY_MAX_QUESTIONS", "3")) or None,
+        compactor=get_compactor(namespace, os.getenv("HISTORY_SUMMARIES", "1") == "1"),
+        keep_full_turns=int(os.getenv("HISTORY_KEEP_FULL_TURNS", "1")),
+    )
+
+@lru_cache(maxsize=None)
+def get_llm_http_clients() -> tuple[httpx.Client, httpx.AsyncClient]:
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "64")),
+        max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "32")),
+        keepalive_expiry=float(os.getenv("LLM_HTTP_KEEPALIVE_SECONDS", "120")),
+    )
+    timeout = httpx.Timeout(float(os.getenv("LLM_HTTP_TIMEOUT_SECONDS", "60")))
+    return httpx.Client(limits=limits, timeout=timeout), httpx.AsyncClient(limits=limits, timeout=timeout)
+
+def set_llm(temperature: float, model_name: Optional[str] = None) -> ChatGroq:
+    http_client, http_async_client = get_llm_http_clients()
+    return ChatGroq(api_key=os.getenv("GROQ_API_KEY"),
+                    model_name=model_name or os.getenv("AI_MODEL"),
+                    temperature=temperature,
+                    max_retries=int(os.getenv("LLM_MAX_RETRIES", "1")),
+                    http_client=http_client,
+                    http_async_client=http_async_client)
+
+def set_call_policy(namespace: str, limiter: Optional[AdaptiveLimiter] = None) -> HedgePolicy:
+    prefix = f"{namespace.upper()}_LLM"
+    return HedgePolicy(
+        deadline=float(os.getenv(f"{prefix}_DEADLINE_SECONDS", os.getenv("LLM_DEADLINE_SECONDS", "30"))) or None,
+        hedge=os.getenv("LLM_HEDGE", "0") == "1",
+        quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+        min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "0.25")),
+        max_delay=float(os.getenv("LLM_HEDGE_MAX_DELAY_SECONDS", "4")),
+        min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+        limiter=limiter,
+    )
+
+def set_sql_agent(engine: Engine, async_engine: Optional[AsyncEngine] = None,
+                  memory: Optional[ChatMemory] = None, limiter: Optional[AdaptiveLimiter] = None) -> IAModel:
+    sql_agent = IAModel("sql")
     sql_agent.set_engine(engine)
-    sql_agent.set_model(
-            ChatGroq(api_key=os.getenv("GROQ_API_KEY"),
-                     model_name=os.getenv("AI_MODEL"),
-                     temperature=0.1,
-                     max_retries=2))
+    sql_agent.set_async_engine(async_engine)
+    sql_agent.set_memory(memory if memory is not None else set_chat_memory("sql"))
+    fast_model = os.getenv("SQL_FAST_MODEL")
+    if fast_model:
+        sql_agent.set_model(set_llm(temperature=0.1, model_name=fast_model))
+        sql_agent.set_cascade_model(set_llm(temperature=0.1))
+    else:
+        sql_agent.set_model(set_llm(temperature=0.1))
+    sql_agent.set_call_policy(set_call_policy("sql", limiter))
     sql_agent.set_prompt(
-            init_prompt([("system", sql_prompt)], table_info=table_info)
+            init_prompt([("system", sql_prompt)])
         )
     return sql_agent
 
-def set_nlp_agent() -> IAModel:
-    nlp_agent = IAModel()
+def set_nlp_agent(memory: Optional[ChatMemory] = None, limiter: Optional[AdaptiveLimiter] = None) -> IAModel:
+    nlp_agent = IAModel("nlp")
+    nlp_agent.set_memory(memory if memory is not None else set_chat_memory("nlp"))
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         raise RuntimeError("La clé API GROQ est manquante dans l'environnement")
     os.environ["GROQ_API_KEY"] = api_key
-    nlp_agent.set_model(
-        ChatGroq(api_key=os.getenv("GROQ_API_KEY"),
-                 model_name=os.getenv("AI_MODEL"),
-                 temperature=0.3, max_retries=2))
+    nlp_agent.set_model(set_llm(temperature=0.3))
+    nlp_agent.set_call_policy(set_call_policy("nlp", limiter))
     nlp_agent.set_prompt(
         init_prompt(
                 [("system", nlp_prompt)],)
                 )
-    return nlp_agent
\ No newline at end of file
+    return nlp_agent
+
+def set_agents(engine: Engine, async_engine: Optional[AsyncEngine] = None,
+               previous: Optional[AgentSet] = None, limiter: Optional[AdaptiveLimiter] = None) -> AgentSet:
+    return AgentSet(
+        set_sql_agent(engine, async_engine, previous.sql_agent.get_memory() if previous else None, limiter),
+        set_nlp_agent(previous.nlp_agent.get_memory() if previous else None, limiter),
+    )
+
+def get_schema_tables() -> list[str]:
+    tables = [table.strip() for table in os.getenv("SCHEMA_TABLES", "").split(",") if table.strip()]
+    return tables or list(table_info)
+
+def set_schema_snapshot(engine: Engine, current: Optional[SchemaSnapshot] = None) -> SchemaSnapshot:
+    if os.getenv("SCHEMA_SNAPSHOT", "1") != "1":
+        return static_snapshot(table_info, get_schema_tables())
+    return load_schema_snapshot(
+        engine,
+        table_info,
+        os.getenv("SCHEMA_SNAPSHOT_PATH", "/tmp/az_schema_snapshot.json"),
+        get_schema_tables(),
+        all_columns=os.getenv("SCHEMA_ALL_COLUMNS", "0") == "1",
+        refresh=current is not None or os.getenv("SCHEMA_SNAPSHOT_REFRESH", "0") == "1",
+        fallback=current,
+    )
+
+def get_sql_fingerprint(snapshot: SchemaSnapshot) -> str:
+    return schema_fingerprint(sql_prompt, snapshot.hash)
+
+def set_sql_cache(snapshot: SchemaSnapshot) -> SQLQueryCache:
+    return SQLQueryCache(
+        fingerprint=get_sql_fingerprint(snapshot),
+        max_size=int(os.getenv("SQL_CACHE_MAX_SIZE", "512")),
+        ttl_seconds=int(os.getenv("SQL_CACHE_TTL_SECONDS", str(6 * 60 * 60))),
+    )
+
+def set_result_cache() -> ResultCache:
+    return ResultCache(
+        max_size=int(os.getenv("RESULT_CACHE_MAX_SIZE", "256")),
+        default_ttl=int(os.getenv("RESULT_CACHE_TTL_SECONDS", "60")),
+    )
+
+def set_schema_index(snapshot: SchemaSnapshot) -> SchemaIndex:
+    return SchemaIndex(snapshot.tables, top_k=int(os.getenv("SCHEMA_TOP_K", "4")))
+
+def set_session_expiry() -> SessionExpiry:
+    return SessionExpiry(int(os.getenv("MEMORY_TIMEOUT_SECONDS", str(10 * 60))))
+
+def set_intent_router() -> Optional[IntentRouter]:
+    if os.getenv("INTENT_ROUTER", "1") != "1":
+        return None
+    return IntentRouter(
+        intent_templates,
+        lookup_queries,
+        min_confidence=float(os.getenv("INTENT_MIN_CONFIDENCE", "0.8")),
+        slot_cutoff=float(os.getenv("INTENT_SLOT_CUTOFF", "0.85")),
+        slot_margin=float(os.getenv("INTENT_SLOT_MARGIN", "0.05")),
+        default_limit=int(os.getenv("INTENT_DEFAULT_LIMIT", "5")),
+    )
+
+def set_answer_formatter(snapshot: SchemaSnapshot) -> Optional[AnswerFormatter]:
+    if os.getenv("ANSWER_FORMATTER", "1") != "1":
+        return None
+    return AnswerFormatter(
+        snapshot.tables,
+        column_labels,
+        subject_columns,
+        max_rows=int(os.getenv("ANSWER_FORMATTER_MAX_ROWS", "10")),
+        max_columns=int(os.getenv("ANSWER_FORMATTER_MAX_COLUMNS", "6")),
+    )
+
+def set_admission() -> AdmissionControl:
+    max_waiting = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+    max_wait = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "10"))
+    return AdmissionControl(
+        llm=AdaptiveLimiter(
+            "llm",
+            limit=int(os.getenv("ADMISSION_LLM_CONCURRENCY", "8")),
+            min_limit=int(os.getenv("ADMISSION_LLM_MIN_CONCURRENCY", "2")),
+            max_limit=int(os.getenv("ADMISSION_LLM_MAX_CONCURRENCY", "32")),
+            max_waiting=max_waiting,
+            max_wait_seconds=max_wait,
+            tolerance=float(os.getenv("ADMISSION_LLM_LATENCY_TOLERANCE", "3")),
+            is_overload=is_llm_overloaded,
+        ),
+        db=AdaptiveLimiter(
+            "db",
+            limit=int(os.getenv("ADMISSION_DB_CONCURRENCY", "8")),
+            min_limit=int(os.getenv("ADMISSION_DB_MIN_CONCURRENCY", "2")),
+            max_limit=int(os.getenv("ADMISSION_DB_MAX_CONCURRENCY", "15")),
+            max_waiting=max_waiting,
+            max_wait_seconds=max_wait,
+            tolerance=None,
+            is_overload=is_db_overloaded,
+        ),
+        sessions=SessionLocks(int(os.getenv("ADMISSION_SESSION_MAX_PENDING", "4"))),
+    )
+
+def set_coalescer() -> Optional[SingleFlight]:
+    max_wait = float(os.getenv("COALESCE_MAX_WAIT_SECONDS", "30"))
+    return SingleFlight(max_wait) if max_wait > 0 else None
+
+def set_read_router(engine, replica_urls_env: str = "DB_REPLICA_URLS", is_async: bool = False) -> EngineRouter:
+    urls = [url.strip() for url in os.getenv(replica_urls_env, "").split(",") if url.strip()]
+    return EngineRouter(
+        engine,
+        replicas=[create_pooled_engine(url, is_async=is_async) for url in urls],
+        cooldown_seconds=float(os.getenv("DB_REPLICA_COOLDOWN_SECONDS", "30")),
+    )
+
+def set_cost_guard() -> Optional[CostGuard]:
+    if os.getenv("QUERY_COST_GUARD", "1") != "1":
+        return None
+    return CostGuard(
+        max_cost=float(os.getenv("QUERY_COST_MAX", "100000")),
+        max_scan_rows=float(os.getenv("QUERY_COST_MAX_SCAN_ROWS", "200000")),
+        max_sort_rows=float(os.getenv("QUERY_COST_MAX_SORT_ROWS", "50000")),
+        cache_size=int(os.getenv("QUERY_COST_CACHE_SIZE", "1024")),
+        ttl_seconds=float(os.getenv("QUERY_COST_CACHE_TTL_SECONDS", "600")),
+    )
@@ -0,0 +1,106 @@
+import math
+import time
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+Attempt = Dict[str, Any]
+Describe = Callable[[str, float, str], Attempt]
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    def __init__(self, deadline: float, attempts: List[Attempt]):
+        super().__init__(f"LLM call exceeded its {deadline}s deadline")
+        self.attempts = attempts
+
+
+class LatencyWindow:
+    def __init__(self, size: int = 200):
+        self._samples: deque = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class HedgePolicy:
+    def __init__(self, deadline: Optional[float] = None, hedge: bool = False, quantile: float = 0.95,
+                 min_delay: float = 0.25, max_delay: float = 4.0, min_samples: int = 20,
+                 limiter: Optional[Any] = None):
+        self.deadline = deadline
+        self.hedge = hedge
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        # a hedge is an extra request: it needs a free slot of this limiter (try_acquire/release)
+        self.limiter = limiter
+
+    def delay(self, window: LatencyWindow) -> Optional[float]:
+        if not self.hedge:
+            return None
+        if len(window) < self.min_samples:
+            return self.max_delay
+        return min(self.max_delay, max(self.min_delay, window.quantile(self.quantile)))
+
+
+async def hedged_call(call: Callable[[], Awaitable[Any]], policy: HedgePolicy, window: LatencyWindow,
+                      describe: Describe) -> Tuple[Any, List[Attempt]]:
+    started = time.perf_counter()
+    delay = policy.delay(window)
+    hedge_at = started + delay if delay is not None else None
+    deadline_at = started + policy.deadline if policy.deadline else None
+    running: Dict[asyncio.Future, Tuple[str, float]] = {}
+    attempts: List[Attempt] = []
+    error: Optional[BaseException] = None
+    leftover = "cancelled"
+
+    def launch(kind: str) -> asyncio.Future:
+        task = asyncio.ensure_future(call())
+        running[task] = (kind, time.perf_counter())
+        return task
+
+    def launch_hedge() -> None:
+        limiter = policy.limiter
+        if limiter is None:
+            launch("hedge")
+        elif limiter.try_acquire():
+            launch("hedge").add_done_callback(lambda _: limiter.release())
+        else:
+            attempts.append(describe("hedge", 0.0, "skipped"))
+
+    launch("primary")
+    try:
+        while running:
+            wake = [moment for moment in (hedge_at, deadline_at) if moment is not None]
+            timeout = max(0.0, min(wake) - time.perf_counter()) if wake else None
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                kind, task_started = running.pop(task)
+                if task.exception() is None:
+                    attempts.append(describe(kind, time.perf_counter() - task_started, "ok"))
+                    window.add(time.perf_counter() - started)
+                    return task.result(), attempts
+                error = task.exception()
+                attempts.append(describe(kind, time.perf_counter() - task_started, "error"))
+            now = time.perf_counter()
+            if deadline_at is not None and now >= deadline_at:
+                leftover = "deadline"
+                raise LLMDeadlineExceeded(policy.deadline, attempts)
+            if hedge_at is not None and now >= hedge_at and running:
+                hedge_at = None
+                launch_hedge()
+        error.attempts = attempts
+        raise error
+    finally:
+        for task, (kind, task_started) in running.items():
+            task.cancel()
+            attempts.append(describe(kind, time.perf_counter() - task_started, leftover))
@@ -0,0 +1,30 @@
+import re
+from typing import Optional
+from app.db.sql_parser import extract_queries
+from app.services.chat import HUMAN, Compactor
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def one_line(text: str, max_chars: int) -> str:
+    line = " ".join(text.split())
+    return line if len(line) <= max_chars else line[:max_chars - 1].rstrip() + "…"
+
+
+def compact_sql_turn(role: str, content: str, max_chars: int = 160) -> str:
+    if role == HUMAN:
+        return one_line(content, max_chars)
+    queries = extract_queries(content, None)
+    return queries[-1] if queries else one_line(content, max_chars)
+
+
+def compact_nlp_turn(role: str, content: str, max_chars: int = 160) -> str:
+    if role == HUMAN:
+        return one_line(content, max_chars)
+    return one_line(SENTENCE_END.split(content.strip(), 1)[0], max_chars)
+
+
+def get_compactor(namespace: str, enabled: bool) -> Optional[Compactor]:
+    if not enabled:
+        return None
+    return compact_sql_turn if namespace == "sql" else compact_nlp_turn
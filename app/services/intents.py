@@ -0,0 +1,228 @@
+import re
+import difflib
+import logging
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from app.db.database import BoundQuery
+from app.prompt.schema_index import STOPWORDS, tokenize
+
+LIMIT_PATTERN = re.compile(
+    r"\b(?:top|premiers?|premieres?|first)\s+(\d{1,3})\b|\b(\d{1,3})\s+(?:premiers?|premieres?|articles?|produits?|items?|resultats?|clients?)\b"
+)
+
+
+def words_of(value: str) -> List[str]:
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(c for c in value if not unicodedata.combining(c)).lower()
+    return [word for word in re.split(r"[^a-z0-9]+", value) if word]
+
+
+def has_digit(word: str) -> bool:
+    return any(c.isdigit() for c in word)
+
+
+def digit_words(words: Sequence[str]) -> List[str]:
+    return sorted(word for word in words if has_digit(word))
+
+
+class SlotMatch(NamedTuple):
+    id: Any
+    name: str
+    score: float
+    words: Tuple[str, ...]
+
+
+class IntentMatch(NamedTuple):
+    intent: str
+    query: BoundQuery
+    confidence: float
+    slot: Optional[SlotMatch]
+
+
+class NameIndex:
+    def __init__(self, rows: Sequence[Tuple[Any, Optional[str], str]], max_postings: int = 1000,
+                 max_candidates: int = 25):
+        self._max_postings = max_postings
+        self._max_candidates = max_candidates
+        self._entries: List[Tuple[Any, str, Tuple[str, ...]]] = []
+        self._codes: Dict[str, List[int]] = defaultdict(list)
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for entry_id, code, name in rows:
+            words = tuple(words_of(name or ""))
+            if not words:
+                continue
+            index = len(self._entries)
+            self._entries.append((entry_id, name, words))
+            if code:
+                self._codes["".join(words_of(code))].append(index)
+            for word in set(words):
+                if word not in STOPWORDS:
+                    self._postings[word].append(index)
+        self._by_initial: Dict[str, List[str]] = defaultdict(list)
+        for word in self._postings:
+            self._by_initial[word[0]].append(word)
+        self._similar: Dict[str, List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def similar_words(self, word: str) -> List[str]:
+        if word in self._postings:
+            return [word]
+        if len(word) < 4 or has_digit(word):
+            return []
+        similar = self._similar.get(word)
+        if similar is None:
+            similar = difflib.get_close_matches(word, self._by_initial.get(word[0], []), n=3, cutoff=0.8)
+            if len(self._similar) < 10000:
+                self._similar[word] = similar
+        return similar
+
+    def match_code(self, words: List[str]) -> Optional[SlotMatch]:
+        for size in (1, 2, 3):
+            for start in range(len(words) - size + 1):
+                span = words[start:start + size]
+                found = self._codes.get("".join(span))
+                if found and len(found) == 1:
+                    entry_id, name, _ = self._entries[found[0]]
+                    return SlotMatch(entry_id, name, 1.0, tuple(span))
+        return None
+
+    def match(self, words: List[str], cutoff: float = 0.85, skip: Set[str] = frozenset(),
+              margin: float = 0.05) -> Optional[SlotMatch]:
+        code = self.match_code(words)
+        if code is not None:
+            return code
+        candidates: Counter = Counter()
+        for word in set(words):
+            if word in STOPWORDS or set(tokenize(word)) & skip:
+                continue
+            for similar in self.similar_words(word):
+                postings = self._postings[similar]
+                if len(postings) <= self._max_postings:
+                    candidates.update(postings)
+
+        scored: List[Tuple[float, int, Tuple[str, ...]]] = []
+        matcher = difflib.SequenceMatcher(autojunk=False)
+        for index, _ in candidates.most_common(self._max_candidates):
+            name_words = self._entries[index][2]
+            name_digits = digit_words(name_words)
+            matcher.set_seq2(" ".join(name_words))
+            best = (0.0, ())
+            for size in {max(1, len(name_words) - 1), len(name_words), len(name_words) + 1}:
+                for start in range(len(words) - size + 1):
+                    span = tuple(words[start:start + size])
+                    # numbers and codes in a name never match approximately ("name 75" is not "name 5")
+                    following = words[start + size] if start + size < len(words) else ""
+                    if digit_words(span) != name_digits or has_digit(following):
+                        continue
+                    matcher.set_seq1(" ".join(span))
+                    if matcher.real_quick_ratio() <= best[0] or matcher.quick_ratio() <= best[0]:
+                        continue
+                    ratio = matcher.ratio()
+                    if ratio > best[0]:
+                        best = (ratio, span)
+            scored.append((best[0], index, best[1]))
+        if not scored:
+            return None
+        scored.sort(key=lambda item: item[0], reverse=True)
+        score, index, span = scored[0]
+        if score < cutoff:
+            return None
+        if len(scored) > 1 and scored[1][0] > score - margin and not score == 1.0 > scored[1][0]:
+            return None
+        entry_id, name, _ = self._entries[index]
+        return SlotMatch(entry_id, name, score, span)
+
+
+class IntentRouter:
+    def __init__(self, templates: Dict[str, Dict[str, Any]], lookup_queries: Dict[str, str],
+                 min_confidence: float = 0.8, slot_cutoff: float = 0.85, slot_margin: float = 0.05,
+                 default_limit: int = 5, max_limit: int = 50):
+        self._lookup_queries = lookup_queries
+        self._min_confidence = min_confidence
+        self._slot_cutoff = slot_cutoff
+        self._slot_margin = slot_margin
+        self._default_limit = default_limit
+        self._max_limit = max_limit
+        self._templates = [
+            (
+                name,
+                [re.compile(pattern) for pattern in template["patterns"]],
+                set(tokenize(" ".join(template["vocabulary"]))),
+                template.get("slot"),
+                template["sql"],
+                tuple(template.get("exclude", ())),
+            )
+            for name, template in templates.items()
+        ]
+        self._indexes: Dict[str, NameIndex] = {}
+        self.hits: Counter = Counter()
+        self.fallbacks = 0
+
+    def refresh(self, engine: Engine) -> int:
+        indexes = {}
+        with engine.connect() as connection:
+            for slot, query in self._lookup_queries.items():
+                try:
+                    rows = connection.execute(text(query)).fetchall()
+                except Exception as e:
+                    logging.warning("Intent lookup index for %s unavailable: %s", slot, e)
+                    rows = []
+                indexes[slot] = NameIndex([tuple(row) for row in rows])
+        self._indexes = indexes
+        return sum(len(index) for index in indexes.values())
+
+    def limit_for(self, normalized: str) -> Tuple[int, Set[str]]:
+        match = LIMIT_PATTERN.search(normalized)
+        if match is None:
+            return self._default_limit, set()
+        value = match.group(1) or match.group(2)
+        return max(1, min(int(value), self._max_limit)), {value}
+
+    def route(self, question: str) -> Optional[IntentMatch]:
+        words = words_of(question)
+        normalized = " ".join(words)
+        content = set(tokenize(normalized))
+        if not content:
+            return None
+        limit, limit_tokens = self.limit_for(normalized)
+        indexes = self._indexes
+        slots: Dict[str, Optional[SlotMatch]] = {}
+        best: Optional[IntentMatch] = None
+        for name, patterns, vocabulary, slot, sql, exclude in self._templates:
+            if not any(pattern.search(normalized) for pattern in patterns):
+                continue
+            params: Dict[str, Any] = {"limit": limit}
+            covered = content & (vocabulary | limit_tokens)
+            score = 1.0
+            if slot is not None:
+                if slot not in slots:
+                    index = indexes.get(slot)
+                    slots[slot] = index.match(words, self._slot_cutoff, vocabulary, self._slot_margin) if index else None
+                found = slots[slot]
+                if found is None:
+                    continue
+                params[f"{slot}_id"] = found.id
+                covered |= content & set(tokenize(" ".join(found.words)))
+                score = found.score
+            # a leftover word like "minimum" or "prix" asks for something the template does not answer
+            if any(word.startswith(exclude) for word in content - covered):
+                continue
+            confidence = score * len(covered) / len(content)
+            if best is None or confidence > best.confidence:
+                best = IntentMatch(name, BoundQuery(sql, params), confidence, slots.get(slot))
+        if best is None or best.confidence < self._min_confidence:
+            self.fallbacks += 1
+            return None
+        self.hits[best.intent] += 1
+        return best
+
+    def stats(self) -> Dict[str, int]:
+        stats = {f"index_{slot}": len(index) for slot, index in self._indexes.items()}
+        stats.update({f"hits_{intent}": count for intent, count in self.hits.items()})
+        stats["fallbacks"] = self.fallbacks
+        return stats
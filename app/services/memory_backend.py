@@ -0,0 +1,105 @@
+import json
+import time
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+Messages = List[Tuple[str, str]]
+
+ROLE_CODES = {"human": "h", "ai": "a"}
+CODE_ROLES = {code: role for role, code in ROLE_CODES.items()}
+
+
+def serialize_messages(messages: Messages) -> str:
+    return json.dumps(
+        [[ROLE_CODES.get(role, role), content] for role, content in messages],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def deserialize_messages(payload: str) -> Messages:
+    return [(CODE_ROLES.get(code, code), content) for code, content in json.loads(payload)]
+
+
+class MemoryBackend:
+    """Storage behind ChatMemory, keyed by (namespace, session_id).
+
+    A key-value server implementation maps each pair to one key holding the
+    serialized window and its last update time (e.g. ``chat:{namespace}:{id}``
+    with a TTL), and implements ``delete_if_idle`` as a conditional delete.
+    """
+
+    shared = False
+
+    def load(self, namespace: str, session_id: int) -> Optional[Messages]:
+        return None
+
+    def save(self, namespace: str, session_id: int, messages: Messages) -> None:
+        pass
+
+    def delete(self, namespace: str, session_id: int) -> None:
+        pass
+
+    def delete_if_idle(self, namespace: str, session_id: int, idle_before: float) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class InProcessBackend(MemoryBackend):
+    pass
+
+
+class SQLiteBackend(MemoryBackend):
+    shared = True
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS chat_memory ("
+                "namespace TEXT NOT NULL, session_id INTEGER NOT NULL, "
+                "payload TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, session_id)) WITHOUT ROWID"
+            )
+
+    def load(self, namespace: str, session_id: int) -> Optional[Messages]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT payload FROM chat_memory WHERE namespace = ? AND session_id = ?",
+                (namespace, session_id),
+            ).fetchone()
+        return deserialize_messages(row[0]) if row else None
+
+    def save(self, namespace: str, session_id: int, messages: Messages) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO chat_memory (namespace, session_id, payload, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (namespace, session_id) DO UPDATE SET "
+                "payload = excluded.payload, updated_at = excluded.updated_at",
+                (namespace, session_id, serialize_messages(messages), time.time()),
+            )
+
+    def delete(self, namespace: str, session_id: int) -> None:
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM chat_memory WHERE namespace = ? AND session_id = ?",
+                (namespace, session_id),
+            )
+
+    def delete_if_idle(self, namespace: str, session_id: int, idle_before: float) -> bool:
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM chat_memory WHERE namespace = ? AND session_id = ? AND updated_at < ?",
+                (namespace, session_id, idle_before),
+            )
+        return cursor.rowcount > 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,325 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 500, 1000)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144)
+CHECKOUT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Labels:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[Sample]:
+        return []
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{format_labels(labels)} {format_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[Sample]:
+        return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._buckets = tuple(sorted(buckets))
+        self._values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self._buckets) + 2)
+            state[bisect.bisect_left(self._buckets, value)] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self) -> List[Sample]:
+        samples = []
+        for key, state in self._values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0.0
+            for bound, count in zip(self._buckets + (float("inf"),), state[:-2]):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": format_number(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, state[-2]))
+            samples.append((f"{self.name}_count", labels, state[-1]))
+        return samples
+
+
+class GaugeCollector(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, collect: Callable[[], Dict[Labels, float]],
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._collect = collect
+
+    def samples(self) -> List[Sample]:
+        return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in self._collect().items()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, description, labelnames))
+
+    def histogram(self, name: str, description: str, buckets: Sequence[float],
+                  labelnames: Sequence[str] = ()) -> Histogram:
+        return self.register(Histogram(name, description, buckets, labelnames))
+
+    def gauge(self, name: str, description: str, collect: Callable[[], Dict[Labels, float]],
+              labelnames: Sequence[str] = ()) -> GaugeCollector:
+        return self.register(GaugeCollector(name, description, collect, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                continue
+        return "\n".join(lines) + "\n"
+
+
+class PipelineMetrics:
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        self.request_seconds = self.registry.histogram(
+            "az_request_duration_seconds", "End-to-end request latency.",
+            LATENCY_BUCKETS, ("endpoint", "status"))
+        self.stage_seconds = self.registry.histogram(
+            "az_stage_duration_seconds", "Latency of each pipeline stage.", LATENCY_BUCKETS, ("stage",))
+        self.result_rows = self.registry.histogram(
+            "az_result_rows", "Rows returned by the generated queries.", ROW_BUCKETS)
+        self.result_bytes = self.registry.histogram(
+            "az_result_serialized_bytes", "Size of the encoded result sent to the NLP agent.", SIZE_BUCKETS)
+        self.llm_tokens = self.registry.counter(
+            "az_llm_tokens_total", "Tokens reported by the LLM provider.", ("agent", "kind"))
+        self.llm_attempt_seconds = self.registry.histogram(
+            "az_llm_attempt_duration_seconds", "LLM call attempts (primary, hedge, cascade) and their outcome.",
+            LATENCY_BUCKETS, ("agent", "model", "kind", "outcome"))
+        self.requests = self.registry.counter(
+            "az_requests_total", "Requests by endpoint and outcome.", ("endpoint", "status"))
+        self.pool_checkout_seconds = self.registry.histogram(
+            "az_db_pool_checkout_seconds", "Time spent waiting for a pooled database connection.",
+            CHECKOUT_BUCKETS, ("engine", "target"))
+
+    def observe_checkouts(self, router: Any, engine: str) -> None:
+        router.set_checkout_observer(
+            lambda target, seconds: self.pool_checkout_seconds.observe(seconds, engine=engine, target=target))
+
+    def record_tokens(self, agent: str, message: Any) -> None:
+        prompt_tokens, completion_tokens = token_usage(message)
+        if prompt_tokens:
+            self.llm_tokens.inc(prompt_tokens, agent=agent, kind="prompt")
+        if completion_tokens:
+            self.llm_tokens.inc(completion_tokens, agent=agent, kind="completion")
+
+
+def token_usage(message: Any) -> Tuple[int, int]:
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return int(usage.get("input_tokens", 0)), int(usage.get("output_tokens", 0))
+    metadata = getattr(message, "response_metadata", None) or {}
+    usage = metadata.get("token_usage") or {}
+    return int(usage.get("prompt_tokens", 0)), int(usage.get("completion_tokens", 0))
+
+
+class RequestTimings:
+    def __init__(self, metrics: Optional[PipelineMetrics] = None):
+        self._metrics = metrics
+        self.stages: Dict[str, float] = {}
+        self.attempts: List[Dict[str, Any]] = []
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if self._metrics is not None:
+            self._metrics.stage_seconds.observe(seconds, stage=name)
+
+    def record_attempts(self, source: Any) -> None:
+        attempts = getattr(source, "attempts", None)
+        if attempts is None:
+            attempts = (getattr(source, "response_metadata", None) or {}).get("attempts", ())
+        for attempt in attempts:
+            self.attempts.append(attempt)
+            if self._metrics is not None:
+                self._metrics.llm_attempt_seconds.observe(
+                    attempt["seconds"], agent=attempt["agent"], model=attempt["model"],
+                    kind=attempt["kind"], outcome=attempt["outcome"])
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def as_milliseconds(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+
+    def server_timing(self) -> str:
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        entries.extend(
+            f'{attempt["agent"]}_llm_{index};desc="{attempt["model"]} {attempt["tier"]}/{attempt["kind"]} {attempt["outcome"]}";'
+            f'dur={attempt["seconds"] * 1000:.1f}'
+            for index, attempt in enumerate(self.attempts, 1)
+        )
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+def pool_stats(engine: Any) -> Dict[str, float]:
+    if engine is None:
+        return {}
+    pool = getattr(getattr(engine, "sync_engine", engine), "pool", None)
+    stats = {}
+    for field in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, field):
+            stats[field] = float(getattr(pool, field)())
+    return stats
+
+
+def register_state_collectors(metrics: PipelineMetrics, state: Any) -> None:
+    def collect_pools() -> Dict[Labels, float]:
+        values = {}
+        for engine_name, router_name in (("sync", "read_router"), ("async", "async_read_router")):
+            router = getattr(state, router_name, None)
+            if router is None:
+                continue
+            for engine in router.engines():
+                for field, value in pool_stats(engine).items():
+                    values[(engine_name, router.name_of(engine), field)] = value
+        return values
+
+    def collect_caches() -> Dict[Labels, float]:
+        values = {}
+        for cache_name in ("sql_cache", "result_cache"):
+            cache = getattr(state, cache_name, None)
+            if cache is not None:
+                for field, value in cache.stats().items():
+                    values[(cache_name, field)] = float(value)
+        return values
+
+    def collect_agents() -> Dict[Labels, float]:
+        values = {}
+        agents = getattr(state, "agents", None)
+        if agents is not None:
+            values[("agents", "version")] = float(agents.version)
+        for agent_name in ("sql_agent", "nlp_agent"):
+            agent = getattr(state, agent_name, None)
+            if agent is None:
+                continue
+            for field, value in agent.get_memory().stats().items():
+                values[(agent_name, f"memory_{field}")] = float(value)
+            for field, value in agent.get_render_stats().items():
+                values[(agent_name, f"prompt_render_{field}")] = float(value)
+            for field, value in agent.get_call_stats().items():
+                values[(agent_name, f"llm_{field}")] = float(value)
+        return values
+
+    def collect_coalescer() -> Dict[Labels, float]:
+        coalescer = getattr(state, "coalescer", None)
+        return {(field,): float(value) for field, value in coalescer.stats().items()} if coalescer else {}
+
+    def collect_intents() -> Dict[Labels, float]:
+        router = getattr(state, "intent_router", None)
+        return {(field,): float(value) for field, value in router.stats().items()} if router else {}
+
+    def collect_answers() -> Dict[Labels, float]:
+        formatter = getattr(state, "answer_formatter", None)
+        return {(shape,): float(count) for shape, count in formatter.stats().items()} if formatter else {}
+
+    def collect_admission() -> Dict[Labels, float]:
+        admission = getattr(state, "admission", None)
+        if admission is None:
+            return {}
+        return {
+            (limiter, field): float(value)
+            for limiter, stats in admission.stats().items() for field, value in stats.items()
+        }
+
+    def collect_cost_guard() -> Dict[Labels, float]:
+        guard = getattr(state, "cost_guard", None)
+        return {(field,): float(value) for field, value in guard.stats().items()} if guard else {}
+
+    def collect_sessions() -> Dict[Labels, float]:
+        expiry = getattr(state, "session_expiry", None)
+        return {(field,): float(value) for field, value in expiry.stats().items()} if expiry else {}
+
+    metrics.registry.gauge("az_db_pool", "Database connection pool state.", collect_pools,
+                           ("engine", "target", "field"))
+    metrics.registry.gauge("az_cache", "Cache sizes and hit/miss counters.", collect_caches, ("cache", "field"))
+    metrics.registry.gauge("az_agent", "Agent memory and prompt render statistics.", collect_agents, ("agent", "field"))
+    metrics.registry.gauge("az_coalescer", "Single-flight request coalescing.", collect_coalescer, ("field",))
+    metrics.registry.gauge("az_intents", "Intent router hits, fallbacks and lookup index sizes.", collect_intents,
+                           ("field",))
+    metrics.registry.gauge("az_formatted_answers", "Answers rendered without the NLP agent, by result shape.",
+                           collect_answers, ("shape",))
+    metrics.registry.gauge("az_admission", "Adaptive LLM/DB concurrency limits, queues and shed requests.",
+                           collect_admission, ("limiter", "field"))
+    metrics.registry.gauge("az_cost_guard", "EXPLAIN cost guard checks, rejections and plan cache hits.",
+                           collect_cost_guard, ("field",))
+    metrics.registry.gauge("az_sessions", "Session expiry index statistics.", collect_sessions, ("field",))
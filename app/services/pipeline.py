@@ -0,0 +1,275 @@
+import os
+import time
+from typing import Any, Optional
+from sqlalchemy import exc
+from starlette.concurrency import run_in_threadpool
+from app.db.database import (
+    BoundQuery,
+    QueryCostError,
+    verify_and_extract_sql_query,
+    execute_queries,
+    aexecute_queries,
+    is_empty_result,
+)
+from app.services.metrics import RequestTimings
+from app.services.result_encoder import encode_results
+from app.services.answer_formatter import NO_MATCH_RESULT
+from app.services.admission import llm_slot, db_slot
+
+MAX_RESULT_LIMIT = 50
+COST_FEEDBACK = (
+    "The previous query was rejected before execution because it is too expensive: {reason}. "
+    "Answer the same question with a cheaper MySQL query: filter and join on indexed columns, "
+    "avoid sorting or aggregating whole large tables."
+)
+
+
+async def run_queries(state: Any, queries: list[Any]) -> list:
+    timeout = float(os.getenv("QUERY_TIMEOUT_SECONDS", "15")) or None
+    async with db_slot(state, max(1, len(queries))):
+        if state.async_read_router is not None:
+            return await aexecute_queries(
+                state.async_read_router, queries, state.result_cache, MAX_RESULT_LIMIT, timeout, state.cost_guard)
+        return await run_in_threadpool(
+            lambda: execute_queries(
+                state.read_router, queries, state.result_cache, MAX_RESULT_LIMIT, timeout, state.cost_guard)
+        )
+
+
+async def warm_up_pools(state: Any) -> bool:
+    min_connections = int(os.getenv("DB_POOL_MIN_CONNECTIONS", "2"))
+    ready = await run_in_threadpool(state.read_router.warm_up, min_connections)
+    if state.async_read_router is not None:
+        ready = await state.async_read_router.awarm_up(min_connections) and ready
+    return ready
+
+
+def replay_cached_queries(state: Any, session_id: int, user_question: str, cache_key: str,
+                          timings: RequestTimings) -> Optional[tuple[list[str], str, None]]:
+    cached = state.sql_cache.get(cache_key)
+    if cached is None:
+        return None
+    sql_content, queries = cached
+    sql_memory = state.sql_agent.get_memory()
+    sql_memory.add_user_message(session_id, user_question)
+    sql_memory.add_ai_message(session_id, sql_content)
+    timings.record("sql_cache_hit", 0.0)
+    return queries, sql_content, None
+
+
+def route_intent(state: Any, session_id: int, user_question: str,
+                 timings: RequestTimings) -> Optional[tuple[list[BoundQuery], str, None]]:
+    if state.intent_router is None:
+        return None
+    with timings.stage("intent_routing"):
+        match = state.intent_router.route(user_question)
+    if match is None:
+        return None
+    sql_content = match.query.render()
+    sql_memory = state.sql_agent.get_memory()
+    sql_memory.add_user_message(session_id, user_question)
+    sql_memory.add_ai_message(session_id, sql_content)
+    return [match.query], sql_content, None
+
+
+def render_schema(state: Any, user_question: str, sql_history: list) -> str:
+    return state.schema_index.render(
+        user_question,
+        [message.content for message in sql_history if message.type == "human"],
+    )
+
+
+async def generate_queries(state: Any, session_id: int, user_question: str,
+                           timings: RequestTimings) -> tuple[list[Any], str, Optional[tuple]]:
+    routed = route_intent(state, session_id, user_question, timings)
+    if routed is not None:
+        return routed
+    sql_history = state.sql_agent.get_memory().get_messages(session_id)
+    cache_key = state.sql_cache.make_key(user_question, sql_history)
+    cached = replay_cached_queries(state, session_id, user_question, cache_key, timings)
+    if cached is not None:
+        return cached
+
+    schema = render_schema(state, user_question, sql_history)
+    async with llm_slot(state):
+        with timings.stage("sql_generation"):
+            sql_result = await state.sql_agent.aget_response_with_memory(
+                session_id, user_question, dynamic_variables={"table_info": schema}
+            )
+    state.metrics.record_tokens("sql", sql_result)
+    timings.record_attempts(sql_result)
+    with timings.stage("sql_extraction"):
+        queries = verify_and_extract_sql_query(sql_result.content, MAX_RESULT_LIMIT)
+    if not queries and state.sql_agent.has_cascade():
+        return await regenerate_queries(state, session_id, user_question, timings)
+    return queries, sql_result.content, (cache_key, sql_result.content)
+
+
+async def generate_queries_batch(state: Any, items: list[tuple[int, str]], timings: list[RequestTimings],
+                                 max_concurrency: int) -> list[Any]:
+    prepared: list[Any] = [None] * len(items)
+    misses = []
+    for index, (session_id, user_question) in enumerate(items):
+        prepared[index] = route_intent(state, session_id, user_question, timings[index])
+        if prepared[index] is not None:
+            continue
+        sql_history = state.sql_agent.get_memory().get_messages(session_id)
+        cache_key = state.sql_cache.make_key(user_question, sql_history)
+        prepared[index] = replay_cached_queries(state, session_id, user_question, cache_key, timings[index])
+        if prepared[index] is None:
+            schema = render_schema(state, user_question, sql_history)
+            misses.append((index, cache_key, (session_id, user_question, {"table_info": schema})))
+    if not misses:
+        return prepared
+
+    async with llm_slot(state, min(len(misses), max_concurrency)):
+        started = time.perf_counter()
+        responses = await state.sql_agent.abatch_responses_with_memory(
+            [request for _, _, request in misses], max_concurrency=max_concurrency
+        )
+        elapsed = time.perf_counter() - started
+    for (index, cache_key, _), sql_result in zip(misses, responses):
+        timings[index].record("sql_generation", elapsed)
+        if isinstance(sql_result, Exception):
+            prepared[index] = sql_result
+            continue
+        state.metrics.record_tokens("sql", sql_result)
+        timings[index].record_attempts(sql_result)
+        with timings[index].stage("sql_extraction"):
+            queries = verify_and_extract_sql_query(sql_result.content, MAX_RESULT_LIMIT)
+        prepared[index] = (queries, sql_result.content, (cache_key, sql_result.content))
+        if not queries and state.sql_agent.has_cascade():
+            session_id, user_question = items[index]
+            try:
+                prepared[index] = await regenerate_queries(state, session_id, user_question, timings[index])
+            except Exception as e:
+                prepared[index] = e
+    return prepared
+
+
+async def fetch_data(state: Any, queries: list[Any], pending_cache_entry: Optional[tuple],
+                     timings: RequestTimings) -> Any:
+    with timings.stage("db_execution"):
+        data = await run_queries(state, queries)
+    state.metrics.result_rows.observe(sum(len(result) for result in data))
+    if pending_cache_entry is not None and queries:
+        cache_key, sql_content = pending_cache_entry
+        state.sql_cache.set(cache_key, (sql_content, queries))
+    if is_empty_result(data):
+        data = dict(NO_MATCH_RESULT)
+    return data
+
+
+async def regenerate_queries(state: Any, session_id: int, user_question: str, timings: RequestTimings,
+                             feedback: Optional[str] = None) -> tuple[list[Any], str, Optional[tuple]]:
+    sql_memory = state.sql_agent.get_memory()
+    sql_history = sql_memory.get_messages(session_id)
+    schema = render_schema(state, user_question, sql_history)
+    if feedback is None:
+        sql_memory.drop_last_answer(session_id)
+    async with llm_slot(state):
+        with timings.stage("sql_regeneration"):
+            sql_result = await state.sql_agent.aget_response_with_memory(
+                session_id, feedback, dynamic_variables={"table_info": schema}, escalate=True
+            )
+    if feedback is not None:
+        sql_memory.fold_last_turn(session_id)
+    state.metrics.record_tokens("sql", sql_result)
+    timings.record_attempts(sql_result)
+    queries = verify_and_extract_sql_query(sql_result.content, MAX_RESULT_LIMIT)
+    cache_key = state.sql_cache.make_key(user_question, sql_history[:-2])
+    return queries, sql_result.content, (cache_key, sql_result.content)
+
+
+async def fetch_checked_data(state: Any, session_id: int, user_question: str, prepared: tuple,
+                             timings: RequestTimings) -> tuple[list[Any], str, Any]:
+    queries, sql_content, pending_cache_entry = prepared
+    retries = int(os.getenv("QUERY_COST_RETRIES", "1"))
+    escalations = 1 if state.sql_agent.has_cascade() else 0
+    while True:
+        try:
+            return queries, sql_content, await fetch_data(state, queries, pending_cache_entry, timings)
+        except QueryCostError as e:
+            if retries <= 0:
+                raise
+            retries -= 1
+            feedback = COST_FEEDBACK.format(reason=e.reason)
+        except exc.DBAPIError:
+            if escalations <= 0:
+                raise
+            escalations -= 1
+            feedback = None
+        queries, sql_content, pending_cache_entry = await regenerate_queries(
+            state, session_id, user_question, timings, feedback)
+
+
+async def resolve_data(state: Any, session_id: int, user_question: str,
+                       timings: RequestTimings) -> tuple[list[Any], Any]:
+    async def compute() -> tuple[list[Any], str, Any]:
+        prepared = await generate_queries(state, session_id, user_question, timings)
+        return await fetch_checked_data(state, session_id, user_question, prepared, timings)
+
+    if state.coalescer is None:
+        queries, _, data = await compute()
+        return queries, data
+
+    sql_memory = state.sql_agent.get_memory()
+    key = state.sql_cache.make_key(user_question, sql_memory.get_messages(session_id))
+    started = time.perf_counter()
+    (queries, sql_content, data), shared = await state.coalescer.run(key, compute)
+    if shared:
+        timings.record("coalesced_wait", time.perf_counter() - started)
+        sql_memory.add_user_message(session_id, user_question)
+        sql_memory.add_ai_message(session_id, sql_content)
+    return queries, data
+
+
+def batch_waves(questions: list[Any]) -> list[list[tuple[int, Any]]]:
+    waves: list[list[tuple[int, Any]]] = []
+    seen: dict[int, int] = {}
+    for index, question in enumerate(questions):
+        wave = seen.get(question.session_id, 0)
+        seen[question.session_id] = wave + 1
+        if wave == len(waves):
+            waves.append([])
+        waves[wave].append((index, question))
+    return waves
+
+
+def nlp_variables(state: Any, queries: list[Any], data: Any) -> dict[str, Any]:
+    encoded = data if isinstance(data, str) else encode_results(
+        data, int(os.getenv("RESULT_TOKEN_BUDGET", "800"))
+    )
+    state.metrics.result_bytes.observe(len(encoded.encode("utf-8")))
+    return {
+        "query": [query.render() if isinstance(query, BoundQuery) else query for query in queries],
+        "data": encoded,
+        "result_limit": MAX_RESULT_LIMIT,
+    }
+
+
+def format_answer(state: Any, session_id: int, user_question: str, data: Any,
+                  timings: RequestTimings) -> Optional[str]:
+    if state.answer_formatter is None:
+        return None
+    with timings.stage("answer_formatting"):
+        answer = state.answer_formatter.format(data)
+    if answer is None:
+        return None
+    nlp_memory = state.nlp_agent.get_memory()
+    nlp_memory.add_user_message(session_id, user_question)
+    nlp_memory.add_ai_message(session_id, answer)
+    return answer
+
+
+def rotate_memories(state: Any, session_id: int, timings: RequestTimings) -> None:
+    with timings.stage("memory_rotation"):
+        state.sql_agent.get_memory().rotate_history(session_id)
+        state.nlp_agent.get_memory().rotate_history(session_id)
+
+
+async def sync_memories(state: Any, session_id: int, operation: str) -> None:
+    for agent in (state.sql_agent, state.nlp_agent):
+        memory = agent.get_memory()
+        if memory.is_shared():
+            await run_in_threadpool(getattr(memory, operation), session_id)
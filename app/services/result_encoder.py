@@ -0,0 +1,105 @@
+import math
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence
+from app.db.database import ResultSet
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def format_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, Decimal):
+        return format(value.normalize(), "f")
+    if isinstance(value, float):
+        return ("%.4f" % value).rstrip("0").rstrip(".")
+    if isinstance(value, datetime):
+        if value.time() == time(0, 0):
+            return value.date().isoformat()
+        return value.strftime("%Y-%m-%d %H:%M")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return str(value)
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", errors="replace")
+    return " ".join(str(value).split())
+
+
+def is_numeric(value: Any) -> bool:
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def summarize_numeric(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> List[str]:
+    lines = []
+    for index, column in enumerate(columns):
+        values = [row[index] for row in rows if row[index] is not None]
+        if not values or not all(is_numeric(v) for v in values):
+            continue
+        lines.append(
+            f"{column}: min={format_value(min(values))} max={format_value(max(values))} "
+            f"sum={format_value(sum(values))}"
+        )
+    return lines
+
+
+def encode_table(columns: Sequence[str], rows: Sequence[Sequence[Any]],
+                 token_budget: int, label: str = "", truncated: bool = False) -> str:
+    header = "\t".join(columns)
+    lines = ["\t".join(format_value(v) for v in row) for row in rows]
+    if truncated:
+        label = f"{label}truncated "
+    full = "\n".join([f"{label}rows={len(rows)}", header] + lines)
+    if estimate_tokens(full) <= token_budget:
+        return full
+
+    summary = [f"{label}rows={len(rows)} (summary)"] + summarize_numeric(columns, rows) + [header]
+    used = estimate_tokens("\n".join(summary))
+    shown = 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if shown and used + cost > token_budget:
+            break
+        summary.append(line)
+        used += cost
+        shown += 1
+    summary.append(f"showing first {shown} of {len(rows)} rows")
+    return "\n".join(summary)
+
+
+def encode_result_set(result: Any, token_budget: int, label: str = "") -> str:
+    if isinstance(result, ResultSet):
+        if not result.rows:
+            return f"{label}rows=0"
+        return encode_table(result.columns, result.rows, token_budget, label, result.truncated)
+    if isinstance(result, dict):
+        result = [result]
+    if not isinstance(result, list) or not all(isinstance(row, dict) for row in result):
+        return label + format_value(result)
+    if not result:
+        return f"{label}rows=0"
+    columns = list(result[0].keys())
+    rows = [tuple(row.get(column) for column in columns) for row in result]
+    return encode_table(columns, rows, token_budget, label)
+
+
+def encode_results(data: Any, token_budget: Optional[int] = 800) -> str:
+    budget = token_budget if token_budget and token_budget > 0 else math.inf
+    if isinstance(data, dict):
+        return " ".join(f"{key}={format_value(value)}" for key, value in data.items())
+    if not isinstance(data, list):
+        return format_value(data)
+    if len(data) == 1:
+        return encode_result_set(data[0], budget)
+    share = budget / max(len(data), 1)
+    return "\n".join(
+        encode_result_set(result, share, f"#{index} ")
+        for index, result in enumerate(data, start=1)
+    )
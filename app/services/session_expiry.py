@@ -0,0 +1,81 @@
+import time
+import heapq
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class SessionExpiry:
+    def __init__(self, timeout_seconds: float):
+        self._timeout = timeout_seconds
+        self._deadlines: Dict[int, float] = {}
+        self._heap: List[Tuple[float, int]] = []
+        self._in_flight: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.expired_count = 0
+
+    def _push(self, session_id: int, now: float) -> None:
+        deadline = now + self._timeout
+        self._deadlines[session_id] = deadline
+        heapq.heappush(self._heap, (deadline, session_id))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(d, s) for s, d in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def get_timeout(self) -> float:
+        return self._timeout
+
+    def touch(self, session_id: int, now: Optional[float] = None) -> None:
+        with self._lock:
+            self._push(session_id, time.time() if now is None else now)
+
+    def begin(self, session_id: int) -> None:
+        with self._lock:
+            self._in_flight[session_id] = self._in_flight.get(session_id, 0) + 1
+            self._push(session_id, time.time())
+
+    def end(self, session_id: int) -> None:
+        with self._lock:
+            remaining = self._in_flight.get(session_id, 1) - 1
+            if remaining > 0:
+                self._in_flight[session_id] = remaining
+            else:
+                self._in_flight.pop(session_id, None)
+            self._push(session_id, time.time())
+
+    @contextmanager
+    def track(self, session_id: int) -> Iterator[None]:
+        self.begin(session_id)
+        try:
+            yield
+        finally:
+            self.end(session_id)
+
+    def last_request(self, session_id: int) -> Optional[float]:
+        deadline = self._deadlines.get(session_id)
+        return deadline - self._timeout if deadline is not None else None
+
+    def expire_due(self, on_expire: Callable[[int], None], now: Optional[float] = None) -> List[int]:
+        now = time.time() if now is None else now
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, session_id = heapq.heappop(self._heap)
+                if self._deadlines.get(session_id) != deadline or session_id in self._in_flight:
+                    continue
+                del self._deadlines[session_id]
+                on_expire(session_id)
+                expired.append(session_id)
+            self.expired_count += len(expired)
+        return expired
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._deadlines),
+            "in_flight": len(self._in_flight),
+            "heap_size": len(self._heap),
+            "expired_total": self.expired_count,
+        }
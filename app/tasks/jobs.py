@@ -1,8 +1,13 @@
 import time
-import os
 import logging
-from typing import Optional
-from app.services.factories import set_nlp_agent, set_sql_agent
+from app.services.factories import (
+    set_agents,
+    get_sql_fingerprint,
+    set_schema_snapshot,
+    set_schema_index,
+    set_answer_formatter,
+)
+from app.services.agents import install_agents
 
 def reset_agents_memory(app) -> None:
     try:
@@ -14,44 +19,78 @@ def reset_agents_memory(app) -> None:
     except Exception as e:
         logging.error(f"Error resetting agents memory: {e}")
 
-def reset_memory_user(app, session_id: int) -> None:
-    logging.info(f"Resetting memory for user: {session_id}...")
+def expire_memory_user(app, session_id: int, idle_before: float) -> None:
+    if hasattr(app.state, "sql_agent"):
+        app.state.sql_agent.get_memory().expire_session(session_id, idle_before)
+    if hasattr(app.state, "nlp_agent"):
+        app.state.nlp_agent.get_memory().expire_session(session_id, idle_before)
+
+
+def check_last_request_per_user(app) -> None:
     try:
-        if hasattr(app.state, "sql_agent"):
-            app.state.sql_agent._memory.clear_history_by_id(session_id)
-        if hasattr(app.state, "nlp_agent"):
-            app.state.nlp_agent._memory.clear_history_by_id(session_id)
-        logging.info(f"Memory for session_id: {session_id} reset successfully.")
+        expiry = getattr(app.state, "session_expiry", None)
+        if expiry is None:
+            return
+        idle_before = time.time() - expiry.get_timeout()
+        expired = expiry.expire_due(lambda session_id: expire_memory_user(app, session_id, idle_before))
+        if expired:
+            logging.info(f"{len(expired)} inactive sessions expired, memory reset.")
     except Exception as e:
-        logging.error(f"Error resetting memory for session_id {session_id}: {e}")
+        logging.error(f"Error checking last request per user: {e}")
 
+def refresh_result_cache_watermarks(app) -> None:
+    try:
+        cache = getattr(app.state, "result_cache", None)
+        if cache is None or not hasattr(app.state, "sql_agent"):
+            return
+        invalidated = cache.refresh_watermarks(app.state.sql_agent.get_engine())
+        if invalidated:
+            logging.info(f"Result cache: {invalidated} entries invalidated by data changes.")
+    except Exception as e:
+        logging.error(f"Error refreshing result cache watermarks: {e}")
 
-def check_last_request_per_user(app, timeout_seconds: Optional[int] = None) -> None:
+def refresh_intent_index(app) -> None:
     try:
-        current_time = int(time.time())
-        default_timeout = int(os.getenv("MEMORY_TIMEOUT_SECONDS", str(10 * 60)))
-        timeout_threshold = timeout_seconds if timeout_seconds is not None else default_timeout
-
-        last_map = getattr(app.state, "last_request_per_user", {})
-        for session_id, last_request_time in list(last_map.items()):
-            if current_time - last_request_time > timeout_threshold:
-                reset_memory_user(app, session_id)
-                try:
-                    del app.state.last_request_per_user[session_id]
-                except Exception:
-                    pass
-                logging.info(
-                    f"Session {session_id} has been inactive for over {timeout_threshold} seconds. Memory reset."
-                )
+        router = getattr(app.state, "intent_router", None)
+        if router is None:
+            return
+        entries = router.refresh(app.state.read_router.primary)
+        logging.info(f"Intent lookup index refreshed with {entries} names.")
     except Exception as e:
-        logging.error(f"Error checking last request per user: {e}")
+        logging.error(f"Error refreshing intent lookup index: {e}")
 
-def reset_llm(app):
+def refresh_schema_snapshot(app) -> None:
     try:
-        engine = app.state.sql_agent._engine
-        app.state.sql_agent = set_sql_agent(engine)
-        app.state.nlp_agent = set_nlp_agent()
-        logging.info("LLM agent has been reset.")
+        current = app.state.schema_snapshot
+        snapshot = set_schema_snapshot(app.state.read_router.primary, current)
+        if snapshot.hash == current.hash:
+            return
+        app.state.schema_index = set_schema_index(snapshot)
+        if getattr(app.state, "answer_formatter", None) is not None:
+            app.state.answer_formatter = set_answer_formatter(snapshot)
+        app.state.schema_snapshot = snapshot
+        sql_cache = getattr(app.state, "sql_cache", None)
+        if sql_cache is not None:
+            sql_cache.set_fingerprint(get_sql_fingerprint(snapshot))
+        result_cache = getattr(app.state, "result_cache", None)
+        if result_cache is not None:
+            result_cache.clear()
+        logging.info(f"Schema changed from {current.hash} to {snapshot.hash}, prompt and caches refreshed.")
     except Exception as e:
-        logging.error(f"Failed to reset LLM agent: {e}")
+        logging.error(f"Error refreshing schema snapshot: {e}")
 
+async def reset_llm(app):
+    current = app.state.agents
+    try:
+        agents = set_agents(
+            current.sql_agent.get_engine(), current.sql_agent.get_async_engine(), previous=current,
+            limiter=app.state.admission.llm,
+        )
+        await agents.warm_up()
+        install_agents(app.state, agents)
+        sql_cache = getattr(app.state, "sql_cache", None)
+        if sql_cache is not None and sql_cache.set_fingerprint(get_sql_fingerprint(app.state.schema_snapshot)):
+            logging.info("SQL cache invalidated after schema or prompt change.")
+        logging.info(f"LLM agents swapped from version {current.version} to {agents.version}.")
+    except Exception as e:
+        logging.error(f"Failed to reset LLM agent, keeping version {current.version}: {e}")
@@ -6,13 +6,26 @@ def create_scheduler() -> AsyncIOScheduler:
     scheduler = AsyncIOScheduler()
     return scheduler
 
-def add_memory_check_job(scheduler: AsyncIOScheduler, func: Callable, app, timeout_minutes: Optional[int] = 1) -> None:
-    scheduler.add_job(func, "interval", minutes=timeout_minutes, args=[app])
+def add_memory_check_job(scheduler: AsyncIOScheduler, func: Callable, app, interval_seconds: Optional[int] = 60) -> None:
+    scheduler.add_job(func, "interval", seconds=interval_seconds, args=[app],
+                      id="check_session_expiry", max_instances=1, coalesce=True)
 
 def add_llm_reset_job(scheduler: AsyncIOScheduler, func: Callable, app) -> None:
     scheduler.add_job(func, "cron", hour=0, minute=0, args=[app], id="reset_llm_midnight")
     scheduler.add_job(func, "cron", hour=12, minute=0, args=[app], id="reset_llm_noon")
 
+def add_watermark_refresh_job(scheduler: AsyncIOScheduler, func: Callable, app, interval_seconds: int = 15) -> None:
+    scheduler.add_job(func, "interval", seconds=interval_seconds, args=[app],
+                      id="refresh_result_cache_watermarks", max_instances=1, coalesce=True)
+
+def add_intent_index_refresh_job(scheduler: AsyncIOScheduler, func: Callable, app, interval_seconds: int = 600) -> None:
+    scheduler.add_job(func, "interval", seconds=interval_seconds, args=[app],
+                      id="refresh_intent_index", max_instances=1, coalesce=True)
+
+def add_schema_snapshot_refresh_job(scheduler: AsyncIOScheduler, func: Callable, app, interval_seconds: int = 3600) -> None:
+    scheduler.add_job(func, "interval", seconds=interval_seconds, args=[app],
+                      id="refresh_schema_snapshot", max_instances=1, coalesce=True)
+
 async def start_scheduler(scheduler: AsyncIOScheduler) -> None:
     try:
         scheduler.start()
@@ -0,0 +1,44 @@
+import sys
+import json
+import argparse
+from typing import Any, Dict, Iterator, Tuple
+
+LOWER_IS_BETTER = ("_ms", "_us", "_seconds")
+
+
+def flatten(report: Dict[str, Any], prefix: str = "") -> Iterator[Tuple[str, float]]:
+    for key, value in report.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from flatten(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, float(value)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = dict(flatten({k: v for k, v in json.load(f).items() if k != "meta"}))
+    with open(args.candidate) as f:
+        candidate = dict(flatten({k: v for k, v in json.load(f).items() if k != "meta"}))
+
+    regressions = 0
+    for name in sorted(baseline.keys() & candidate.keys()):
+        before, after = baseline[name], candidate[name]
+        if not name.endswith(LOWER_IS_BETTER + ("throughput_rps",)) or before == 0:
+            continue
+        change = (after - before) / before
+        worse = change < -args.threshold if name.endswith("throughput_rps") else change > args.threshold
+        regressions += worse
+        print(f"{'REGRESSION' if worse else 'ok':<10} {name:<60} {before:>12.2f} -> {after:>12.2f} ({change:+.1%})")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import time
+import asyncio
+import zlib
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+SQL_TEMPLATES = {
+    "rupture": (
+        "SELECT i.code, i.name, s.store_id, s.quantity FROM items i "
+        "JOIN stocks s ON s.item_id = i.id WHERE s.quantity <= 0;"
+    ),
+    "minimum": (
+        "SELECT i.code, i.name, s.quantity, s.min_quantity FROM items i "
+        "JOIN stocks s ON s.item_id = i.id WHERE s.quantity < s.min_quantity;"
+    ),
+    "mouvement": (
+        "SELECT m.type, COUNT(*) AS movements, SUM(m.quantity) AS total FROM stock_movements m "
+        "WHERE m.item_id = {item_id} GROUP BY m.type;"
+    ),
+    "vente": "SELECT COUNT(*) AS sales, SUM(m.quantity) AS total FROM stock_movements m WHERE m.type = 'vente';",
+    "client": "SELECT c.code, c.name, c.solde, c.plafond FROM customers c ORDER BY c.solde DESC LIMIT 5;",
+    "stock": (
+        "SELECT i.code, i.name, SUM(s.quantity) AS quantity FROM items i "
+        "JOIN stocks s ON s.item_id = i.id WHERE i.id = {item_id} GROUP BY i.code, i.name;"
+    ),
+}
+
+QUESTIONS = [
+    "Quels articles sont en rupture de stock ?",
+    "Quels articles sont sous le stock minimum ?",
+    "Quels sont les mouvements de l'article {n} ?",
+    "Combien de ventes au total ?",
+    "Quel client a le plus gros solde ?",
+    "Quel est le stock de l'article {n} ?",
+]
+
+
+def last_human_message(messages: List[BaseMessage]) -> str:
+    for message in reversed(messages):
+        if message.type == "human":
+            return str(message.content)
+    return ""
+
+
+def sql_responder(messages: List[BaseMessage]) -> str:
+    question = last_human_message(messages).lower()
+    item_id = zlib.crc32(question.encode("utf-8")) % 1000 + 1
+    for keyword, template in SQL_TEMPLATES.items():
+        if keyword in question:
+            return "```sql\n" + template.format(item_id=item_id) + "\n```"
+    return "```sql\n" + SQL_TEMPLATES["stock"].format(item_id=item_id) + "\n```"
+
+
+def make_text_responder(output_tokens: int) -> Callable[[List[BaseMessage]], str]:
+    words = ("Le stock actuel est de 150 unités pour cet article dans le magasin principal").split()
+    text = " ".join(words[i % len(words)] for i in range(output_tokens))
+    return lambda messages: text
+
+
+class FakeChatModel(BaseChatModel):
+    responder: Callable[[List[BaseMessage]], str]
+    latency_seconds: float = 0.0
+    stream_token_seconds: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        text = self.responder(messages)
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 4
+        message = AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": len(text) // 4,
+                "total_tokens": prompt_tokens + len(text) // 4,
+            },
+            response_metadata={"model_name": self._llm_type},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency_seconds)
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency_seconds)
+        return self._result(messages)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency_seconds)
+        for word in self.responder(messages).split(" "):
+            time.sleep(self.stream_token_seconds)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency_seconds)
+        for word in self.responder(messages).split(" "):
+            await asyncio.sleep(self.stream_token_seconds)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
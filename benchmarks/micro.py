@@ -0,0 +1,65 @@
+import timeit
+from typing import Any, Callable, Dict
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from app.db.database import verify_and_extract_sql_query, extract_content
+from app.db.sql_parser import parse_queries
+from app.services.chat import ChatMemory
+
+LLM_OUTPUTS = [
+    "SELECT i.code, i.name FROM items i WHERE i.is_active = 1;",
+    "```sql\nSELECT i.code, i.name, s.quantity FROM items i JOIN stocks s ON s.item_id = i.id "
+    "WHERE s.quantity <= 0 ORDER BY s.quantity LIMIT 200;\n```",
+    "Voici la requête :\n```sql\nSELECT c.name, c.solde FROM customers c WHERE LOWER(c.name) LIKE LOWER('%dupont%');"
+    "\nSELECT COUNT(*) FROM invoices inv WHERE inv.paid = 0;\n```\nCette requête liste les clients.",
+    "WITH totals AS (SELECT m.item_id, SUM(m.quantity) AS total FROM stock_movements m GROUP BY m.item_id) "
+    "SELECT i.name, t.total FROM items i JOIN totals t ON t.item_id = i.id ORDER BY t.total DESC;",
+]
+
+
+def measure(func: Callable[[], Any], number: int, repeat: int = 5) -> Dict[str, float]:
+    timings = timeit.repeat(func, number=number, repeat=repeat)
+    best = min(timings) / number
+    return {"best_us": best * 1e6, "mean_us": sum(timings) / (number * repeat) * 1e6, "calls": number}
+
+
+def bench_verify_and_extract(number: int = 200) -> Dict[str, float]:
+    def run():
+        for output in LLM_OUTPUTS:
+            verify_and_extract_sql_query(output, 50)
+    return measure(run, number)
+
+
+def bench_parse_uncached(number: int = 200) -> Dict[str, float]:
+    def run():
+        for output in LLM_OUTPUTS:
+            parse_queries(output, 50)
+    return measure(run, number)
+
+
+def bench_extract_content(engine: Engine, rows: int = 50, number: int = 200) -> Dict[str, float]:
+    query = text(f"SELECT * FROM stock_movements LIMIT {rows}")
+    with engine.connect() as connection:
+        def run():
+            extract_content(connection.execute(query), 50)
+        return measure(run, number)
+
+
+def bench_rotate_history(number: int = 20000) -> Dict[str, float]:
+    memory = ChatMemory()
+    answer = "Le stock actuel est de 150 unités. " * 10
+
+    def run():
+        memory.add_user_message(1, "Quel est le stock de l'article A000042 ?")
+        memory.add_ai_message(1, answer)
+        memory.rotate_history(1, max_questions=3)
+    return measure(run, number)
+
+
+def run_micro(engine: Engine) -> Dict[str, Dict[str, float]]:
+    return {
+        "verify_and_extract_sql_query": bench_verify_and_extract(),
+        "sql_parser_uncached": bench_parse_uncached(),
+        "extract_content_50_rows": bench_extract_content(engine),
+        "chat_memory_rotate_history": bench_rotate_history(),
+    }
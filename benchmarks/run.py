@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import subprocess
+import importlib.util
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline benchmark for the /predict pipeline")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--unique-questions", action="store_true",
+                        help="make every question distinct so caches never hit")
+    parser.add_argument("--sql-latency", type=float, default=0.3)
+    parser.add_argument("--nlp-latency", type=float, default=0.5)
+    parser.add_argument("--nlp-tokens", type=int, default=60)
+    parser.add_argument("--movements", type=int, default=1_000_000)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--db-path", default="/tmp/az_bench.sqlite3")
+    parser.add_argument("--rebuild-db", action="store_true")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--no-intents", action="store_true",
+                        help="disable the intent router so every question goes through the SQL agent")
+    parser.add_argument("--no-formatter", action="store_true",
+                        help="disable the deterministic answer formatter so every answer goes through the NLP agent")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--output", default="bench_output.json")
+    return parser.parse_args()
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db_path}"
+    if importlib.util.find_spec("aiosqlite") is not None:
+        os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{args.db_path}"
+    else:
+        os.environ["DB_ASYNC"] = "0"
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ.setdefault("AI_MODEL", "benchmark")
+    os.environ["RESULT_CACHE_WATERMARK_SECONDS"] = "0"
+    os.environ.setdefault("SCHEMA_SNAPSHOT_PATH", f"{args.db_path}.schema.json")
+    if args.no_intents:
+        os.environ["INTENT_ROUTER"] = "0"
+    if args.no_formatter:
+        os.environ["ANSWER_FORMATTER"] = "0"
+    if args.no_cache:
+        os.environ["SQL_CACHE_MAX_SIZE"] = "0"
+        os.environ["RESULT_CACHE_MAX_SIZE"] = "0"
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": max(values) * 1000 if values else 0.0,
+    }
+
+
+def parse_server_timing(header: str) -> List[Tuple[str, float]]:
+    entries = []
+    for entry in filter(None, (part.strip() for part in header.split(","))):
+        name, _, duration = entry.partition(";dur=")
+        if duration and name != "total":
+            entries.append((name, float(duration) / 1000))
+    return entries
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+async def drive_predict(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+    import app.main as main
+    from benchmarks.fake_llm import FakeChatModel, QUESTIONS, sql_responder, make_text_responder
+
+    stages: Dict[str, List[float]] = defaultdict(list)
+
+    await main.app.router.startup()
+    try:
+        main.app.state.sql_agent.set_model(
+            FakeChatModel(responder=sql_responder, latency_seconds=args.sql_latency))
+        main.app.state.nlp_agent.set_model(
+            FakeChatModel(responder=make_text_responder(args.nlp_tokens), latency_seconds=args.nlp_latency))
+
+        latencies: List[float] = []
+        errors = 0
+        queue: asyncio.Queue = asyncio.Queue()
+        for n in range(args.requests):
+            question = QUESTIONS[n % len(QUESTIONS)].format(n=n % 97 + 1)
+            if args.unique_questions:
+                question = f"{question} #{n}"
+            queue.put_nowait((n % args.sessions, question))
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def worker():
+                nonlocal errors
+                while not queue.empty():
+                    session_id, question = queue.get_nowait()
+                    start = time.perf_counter()
+                    response = await client.post(
+                        "/predict", json={"question": question, "session_id": session_id})
+                    latencies.append(time.perf_counter() - start)
+                    for name, seconds in parse_server_timing(response.headers.get("server-timing", "")):
+                        stages[name].append(seconds)
+                    if response.status_code != 200:
+                        errors += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+    finally:
+        await main.app.router.shutdown()
+
+    return {
+        "latency": summarize(latencies),
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "errors": errors,
+        "stages": {name: summarize(values) for name, values in stages.items()},
+        "llm_tokens": {
+            f"{labels['agent']}_{labels['kind']}": value
+            for _, labels, value in main.app.state.metrics.llm_tokens.samples()
+        },
+        "sql_cache": main.app.state.sql_cache.stats(),
+        "result_cache": main.app.state.result_cache.stats(),
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    configure_environment(args)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from sqlalchemy import create_engine
+    from benchmarks.sqlite_db import build_database
+    from benchmarks.micro import run_micro
+
+    started = time.perf_counter()
+    build_database(args.db_path, movements=args.movements, items=args.items, force=args.rebuild_db)
+    setup_seconds = time.perf_counter() - started
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "db_setup_seconds": setup_seconds,
+            "params": vars(args),
+        },
+        "predict": asyncio.run(drive_predict(args)),
+    }
+    if not args.skip_micro:
+        report["micro"] = run_micro(create_engine(os.environ["DATABASE_URL"]))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps({"predict": report["predict"]["latency"],
+                      "throughput_rps": report["predict"]["throughput_rps"]}, indent=2))
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import re
+import sys
+import random
+import timeit
+import argparse
+from typing import Callable, Dict, List, Optional, Tuple
+from app.db.sql_parser import parse_queries, tokenize, FORBIDDEN_WORDS
+
+MAX_LIMIT = 50
+
+CASES: List[Tuple[str, List[str]]] = [
+    ("SELECT i.code, i.name FROM items i WHERE i.is_active = 1;",
+     ["SELECT i.code, i.name FROM items i WHERE i.is_active = 1 LIMIT 50;"]),
+    ("```sql\nSELECT i.code, s.quantity FROM items i JOIN stocks s ON s.item_id = i.id\n"
+     "WHERE s.quantity <= 0 ORDER BY s.quantity LIMIT 200;\n```",
+     ["SELECT i.code, s.quantity FROM items i JOIN stocks s ON s.item_id = i.id "
+      "WHERE s.quantity <= 0 ORDER BY s.quantity LIMIT 50;"]),
+    ("Voici la requête :\n```sql\nSELECT c.name FROM customers c WHERE LOWER(c.name) LIKE LOWER('%dupont%');\n"
+     "SELECT COUNT(*) FROM invoices inv WHERE inv.paid = 0;\n```\nCette requête liste les clients.",
+     ["SELECT c.name FROM customers c WHERE LOWER(c.name) LIKE LOWER('%dupont%') LIMIT 50;",
+      "SELECT COUNT(*) FROM invoices inv WHERE inv.paid = 0 LIMIT 50;"]),
+    ("SELECT name FROM items WHERE name = 'vis; écrou' LIMIT 10;",
+     ["SELECT name FROM items WHERE name = 'vis; écrou' LIMIT 10;"]),
+    ("SELECT name FROM items WHERE name LIKE '%l''huile%'",
+     ["SELECT name FROM items WHERE name LIKE '%l''huile%' LIMIT 50;"]),
+    ("SELECT i.name FROM items i WHERE i.id IN (SELECT item_id FROM stocks LIMIT 500)",
+     ["SELECT i.name FROM items i WHERE i.id IN (SELECT item_id FROM stocks LIMIT 500) LIMIT 50;"]),
+    ("select name from items limit 5, 400",
+     ["select name from items limit 5, 50;"]),
+    ("SELECT name FROM items LIMIT 80 OFFSET 20;",
+     ["SELECT name FROM items LIMIT 50 OFFSET 20;"]),
+    ("WITH totals AS (SELECT m.item_id, SUM(m.quantity) AS total FROM stock_movements m GROUP BY m.item_id)\n"
+     "SELECT i.name, t.total FROM items i JOIN totals t ON t.item_id = i.id ORDER BY t.total DESC;",
+     ["WITH totals AS (SELECT m.item_id, SUM(m.quantity) AS total FROM stock_movements m GROUP BY m.item_id) "
+      "SELECT i.name, t.total FROM items i JOIN totals t ON t.item_id = i.id ORDER BY t.total DESC LIMIT 50;"]),
+    ("(SELECT code FROM items WHERE is_active = 1) UNION (SELECT code FROM services) LIMIT 100;",
+     ["(SELECT code FROM items WHERE is_active = 1) UNION (SELECT code FROM services) LIMIT 50;"]),
+    ("-- articles en rupture\nSELECT code /* code article */ FROM items; # fin",
+     ["SELECT code FROM items LIMIT 50;"]),
+    ("SELECT `order`, REPLACE(name, 'a', 'b') FROM `select` LIMIT 3;",
+     ["SELECT `order`, REPLACE(name, 'a', 'b') FROM `select` LIMIT 3;"]),
+    ("DELETE FROM items; SELECT COUNT(*) FROM items;",
+     ["SELECT COUNT(*) FROM items LIMIT 50;"]),
+    ("SELECT * FROM items INTO OUTFILE '/tmp/items.csv';", []),
+    ("SELECT * FROM stocks FOR UPDATE;", []),
+    ("UPDATE stocks SET quantity = 0;", []),
+    ("Je ne peux pas répondre à cette question.", []),
+]
+
+FRAGMENTS = [
+    "SELECT", "select", "WITH", "FROM items", "WHERE", "name = 'a;b'", "'unterminated", "\"x\"",
+    "LIMIT", "LIMIT 500", "LIMIT 5, 999", "(", ")", ";", ";;", "--", "/*", "*/", "#", "```", "```sql\n",
+    "\n", "  ", "UNION", "DROP TABLE items", "INTO", "FOR UPDATE", "`weird``name`", "Voici :", "''",
+    "COUNT(*)", "\\'", "1.5", "é", "REPLACE", "REPLACE(", "CHARACTER SET utf8",
+]
+
+
+def legacy_extract(output: str, max_limit: Optional[int]) -> Optional[List[str]]:
+    try:
+        import sqlparse
+    except ImportError:
+        return None
+    formatted = sqlparse.format(output, reindent=True, keyword_case="upper")
+    words, switch = [], False
+    for word in formatted.split():
+        if word == "SELECT":
+            switch = True
+        if switch:
+            words.append(word)
+        if word.find(";") != -1:
+            switch = False
+    queries = []
+    for query in " ".join(words).split(";"):
+        query = query.strip()
+        if not query:
+            continue
+        match = re.search(r"\bLIMIT\s+(\d+)", query, re.IGNORECASE)
+        if match and int(match.group(1)) > max_limit:
+            query = re.sub(r"\bLIMIT\s+\d+", f"LIMIT {max_limit}", query, flags=re.IGNORECASE)
+        elif not match:
+            query += f" LIMIT {max_limit}"
+        queries.append(query + ";")
+    return queries
+
+
+def check_invariants(output: str, queries: List[str]) -> List[str]:
+    problems = []
+    for query in queries:
+        if not query.endswith(";"):
+            problems.append(f"missing terminator: {query!r}")
+        statements = tokenize(query)
+        if len(statements) != 1:
+            problems.append(f"not a single statement: {query!r}")
+            continue
+        tokens = statements[0]
+        words = [value.upper() for kind, value, _ in tokens if kind == "word"]
+        first = next((value for kind, value, _ in tokens if kind not in ("space", "open")), "")
+        if first.upper() not in ("SELECT", "WITH"):
+            problems.append(f"not read-only: {query!r}")
+        if FORBIDDEN_WORDS.intersection(words) - {"SET"}:
+            problems.append(f"forbidden keyword: {query!r}")
+        base_depth = tokens[0][2]
+        limits = [index for index, (kind, value, depth) in enumerate(tokens)
+                  if kind == "word" and depth == base_depth and value.upper() == "LIMIT"]
+        if not limits:
+            problems.append(f"missing outer LIMIT: {query!r}")
+            continue
+        values = [value for kind, value, _ in tokens[limits[-1]:] if kind == "number"][:2]
+        count = values[-1] if "," in "".join(v for _, v, _ in tokens[limits[-1]:limits[-1] + 6]) else values[0]
+        if float(count) > MAX_LIMIT:
+            problems.append(f"LIMIT above {MAX_LIMIT}: {query!r}")
+    return problems
+
+
+def fuzz(iterations: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    failures = []
+    for _ in range(iterations):
+        base = rng.choice(CASES)[0]
+        pieces = [base] + rng.sample(FRAGMENTS, rng.randint(1, 6))
+        rng.shuffle(pieces)
+        output = " ".join(pieces)
+        try:
+            queries = parse_queries(output, MAX_LIMIT)
+        except Exception as e:
+            failures.append(f"{type(e).__name__} on {output!r}: {e}")
+            continue
+        failures.extend(check_invariants(output, queries))
+    return failures
+
+
+def measure(func: Callable[[], object], number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def run_corpus(number: int = 200) -> Dict[str, object]:
+    mismatches = []
+    for output, expected in CASES:
+        queries = parse_queries(output, MAX_LIMIT)
+        if queries != expected:
+            mismatches.append({"input": output, "expected": expected, "got": queries})
+
+    outputs = [output for output, _ in CASES]
+    report: Dict[str, object] = {
+        "cases": len(CASES),
+        "mismatches": mismatches,
+        "parser_us_per_corpus": measure(lambda: [parse_queries(o, MAX_LIMIT) for o in outputs], number),
+    }
+    if legacy_extract("SELECT 1", MAX_LIMIT) is not None:
+        report["legacy_us_per_corpus"] = measure(lambda: [legacy_extract(o, MAX_LIMIT) for o in outputs], number)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Correctness corpus, fuzzing and timing for the SQL extractor")
+    parser.add_argument("--fuzz", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    report = run_corpus(args.number)
+    failures = fuzz(args.fuzz, args.seed)
+    for mismatch in report["mismatches"]:
+        print(f"MISMATCH {mismatch}")
+    for failure in failures[:20]:
+        print(f"FUZZ {failure}")
+    print(f"cases={report['cases']} mismatches={len(report['mismatches'])} "
+          f"fuzz={args.fuzz} failures={len(failures)}")
+    print(f"parser: {report['parser_us_per_corpus']:.1f} us/corpus")
+    if "legacy_us_per_corpus" in report:
+        print(f"legacy (sqlparse): {report['legacy_us_per_corpus']:.1f} us/corpus")
+    sys.exit(1 if report["mismatches"] or failures else 0)
+
+
+if __name__ == "__main__":
+    main()
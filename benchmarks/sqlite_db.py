@@ -0,0 +1,99 @@
+import os
+import random
+import sqlite3
+from typing import Any, Dict, Iterator, Tuple
+from app.prompt.table_info import table_info
+
+INTEGER_HINTS = ("id", "quantity", "is_active", "paid", "invoiced", "blocked", "store_id")
+REAL_HINTS = ("price", "total", "cost", "solde", "plafond", "remise", "tva", "rate")
+DATE_HINTS = ("date", "created_at")
+MOVEMENT_TYPES = ("achat", "vente", "retour", "transfert", "inventaire")
+
+N_STORES = 5
+
+
+def column_type(column: str) -> str:
+    if column == "id" or column.endswith("_id") or any(hint in column for hint in INTEGER_HINTS):
+        return "INTEGER"
+    if any(hint in column for hint in REAL_HINTS):
+        return "REAL"
+    return "TEXT"
+
+
+def synthetic_value(column: str, row: int, rng: random.Random, n_items: int) -> Any:
+    if column == "id":
+        return row
+    if column == "item_id":
+        return rng.randint(1, n_items)
+    if column == "store_id":
+        return rng.randint(1, N_STORES)
+    if column == "article_code" or column == "code":
+        return f"A{rng.randint(1, n_items):06d}" if column == "article_code" else f"C{row:06d}"
+    if column == "type":
+        return MOVEMENT_TYPES[row % len(MOVEMENT_TYPES)]
+    if any(hint in column for hint in DATE_HINTS):
+        return f"2024-{row % 12 + 1:02d}-{row % 28 + 1:02d} 10:00:00"
+    kind = column_type(column)
+    if kind == "INTEGER":
+        return rng.randint(0, 1) if column in ("is_active", "paid", "invoiced", "blocked") else rng.randint(-5, 200)
+    if kind == "REAL":
+        return round(rng.uniform(1, 5000), 2)
+    return f"{column} {row}"
+
+
+def create_schema(connection: sqlite3.Connection) -> None:
+    for table, info in table_info.items():
+        columns = list(info["columns"])
+        definitions = [f"{column} {column_type(column)}" for column in columns]
+        if "id" not in columns:
+            definitions.insert(0, "id INTEGER")
+        definitions[[d.split()[0] for d in definitions].index("id")] += " PRIMARY KEY"
+        connection.execute(f"DROP TABLE IF EXISTS {table}")
+        connection.execute(f"CREATE TABLE {table} ({', '.join(definitions)})")
+
+
+def table_rows(table: str, count: int, n_items: int, seed: int) -> Iterator[Tuple[Any, ...]]:
+    rng = random.Random(f"{seed}:{table}")
+    columns = list(table_info[table]["columns"])
+    for row in range(1, count + 1):
+        values = [synthetic_value(column, row, rng, n_items) for column in columns]
+        if table == "items":
+            values[columns.index("code")] = f"A{row:06d}"
+        if "id" not in columns:
+            values.insert(0, row)
+        yield tuple(values)
+
+
+def populate(connection: sqlite3.Connection, counts: Dict[str, int], n_items: int, seed: int) -> None:
+    for table, info in table_info.items():
+        width = len(info["columns"]) + (0 if "id" in info["columns"] else 1)
+        placeholders = ", ".join("?" for _ in range(width))
+        connection.executemany(
+            f"INSERT INTO {table} VALUES ({placeholders})",
+            table_rows(table, counts.get(table, counts["default"]), n_items, seed),
+        )
+    connection.execute("CREATE INDEX idx_stocks_item ON stocks (item_id)")
+    connection.execute("CREATE INDEX idx_movements_item ON stock_movements (item_id)")
+    connection.execute("CREATE INDEX idx_movements_created ON stock_movements (created_at)")
+
+
+def build_database(path: str, movements: int = 1_000_000, items: int = 1000,
+                   default_rows: int = 1000, seed: int = 42, force: bool = False) -> str:
+    if os.path.exists(path) and not force:
+        return path
+    if os.path.exists(path):
+        os.remove(path)
+    counts = {
+        "default": default_rows,
+        "items": items,
+        "stocks": items * N_STORES,
+        "stock_movements": movements,
+    }
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    create_schema(connection)
+    populate(connection, counts, items, seed)
+    connection.commit()
+    connection.close()
+    return path